@@ -142,12 +142,24 @@ REST_FRAMEWORK = {
     ),
     # Pagination defaults
     # Consider https://www.django-rest-framework.org/api-guide/pagination
+    # Note: The employee, appointment and account endpoints use polls.pagination.KeysetPagination
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     # 'PAGE_SIZE': 200,
 
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    # JSON is rendered and parsed with orjson if it is installed (see polls.renderers)
+    # Measure with: python manage.py benchmark_json
+    'DEFAULT_RENDERER_CLASSES': (
+        'polls.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'polls.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # The user model to be used for authentication
@@ -160,6 +172,57 @@ POLLS = {
 
     # How many days in advance the first reminder is displayed for an appointment
     'NOTIFY_APPOINTMENT_AHEAD': 31,
+
+    # How many compiled letter templates are kept in memory by polls.utils.fill_template
+    'TEMPLATE_CACHE_SIZE': 64,
+
+    # How many worker processes render cover letter PDFs in batch runs (None: one per CPU)
+    'PDF_RENDER_WORKERS': None,
+
+    # How many worker processes the run_pdf_worker command uses to render queued PDF jobs
+    'PDF_JOB_WORKERS': 2,
+
+    # How often a failed PDF job is attempted before it is marked as failed
+    'PDF_JOB_MAX_ATTEMPTS': 3,
+
+    # After how many minutes a running PDF job is considered abandoned and queued again
+    'PDF_JOB_TIMEOUT_MINUTES': 30,
+
+    # After how many hours finished PDF jobs and their documents are deleted
+    'PDF_JOB_EXPIRY_HOURS': 24,
+
+    # Directory and size cap (in bytes) of the on-disk cache of rendered cover letters
+    'LETTER_CACHE_DIR': os.path.join(BASE_DIR, 'cache', 'letters'),
+    'LETTER_CACHE_MAX_BYTES': 256 * 1024 * 1024,
+
+    # How many objects a single request to the bulk endpoints (e.g. /employees/bulk/) may contain
+    'BULK_MAX_ITEMS': 5000,
+
+    # How many rows of an employee import are validated and written at once
+    'IMPORT_CHUNK_SIZE': 500,
+
+    # How many of the invalid rows of an employee import are reported by the import endpoint
+    'IMPORT_ERROR_SAMPLE_SIZE': 100,
+
+    # How many rows of an export are fetched from the database and sent to the client at once
+    'EXPORT_CHUNK_SIZE': 2000,
+
+    # Whether the employee and appointment lists are serialized from values_list() rows (see polls.views.LeanListMixin)
+    'LEAN_LIST_SERIALIZATION': True,
+
+    # How many employees the recompute_reminders command updates per transaction
+    'REMINDER_CHUNK_SIZE': 20000,
+
+    # How many seconds the watermark of a delta synchronization lies in the past, so that the next delta also
+    # contains rows which were stamped before but committed after the previous one
+    'DELTA_SYNC_MARGIN_SECONDS': 60,
+
+    # After how many days the records of deleted objects are pruned, older deltas require a full resynchronization
+    'TOMBSTONE_RETENTION_DAYS': 30,
+
+    # How many appointments the automatic scheduler assigns per day and on which weekdays (0 is Monday)
+    'SCHEDULER_DAILY_CAPACITY': 20,
+    'SCHEDULER_WEEKDAYS': (0, 1, 2, 3, 4),
 }
 
 ############################################################
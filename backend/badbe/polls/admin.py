@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, ReadOnlyPasswordHashField
 from polls.models import Employee, Department, Account, Template
-from polls.models import Employee, Department, Account, Appointment
+from polls.models import Employee, Department, Account, Appointment, PdfJob
 
 # Django's built-in UserCreationForm and UserChangeForm are tied to User and need to be
 # rewritten or extended to work with a custom user model
@@ -88,3 +88,4 @@ admin.site.register(Department)
 admin.site.register(Employee)
 admin.site.register(Template)
 admin.site.register(Appointment)
+admin.site.register(PdfJob)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PollsConfig(AppConfig):
     name = 'polls'
+
+    def ready(self):
+        # connect the signal handlers
+        import polls.signals  # noqa: F401
@@ -0,0 +1,255 @@
+"""
+This file implements creating and modifying batches of employees and appointments.
+
+A batch is validated with one query per related model and unique field instead of several queries per object,
+written with `bulk_create`/`bulk_update` in a single transaction, and the derived fields of the employees
+(`next_reminder` etc.) are computed set-wise afterwards. See `polls.views.BulkMixin` for the endpoints.
+"""
+
+from django.db import transaction
+from django.db.models import Model
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+
+from polls.models import Appointment, Employee, TableVersion, rows_written
+from polls.serializers import EmployeeSerializer, AppointmentSerializer, CachedPrimaryKeyRelatedField
+
+
+def _to_value(value):
+    return value.pk if isinstance(value, Model) else value
+
+
+def _to_pk(value):
+    try:
+        return None if isinstance(value, bool) else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# The fields identifying the inserted rows of a model on databases which do not return their primary keys
+NATURAL_KEYS = {
+    Employee: ('employee_id',),
+    Appointment: ('employee_id', 'date'),
+}
+
+
+def bulk_create_with_pks(model, objs):
+    """
+    Inserts the given objects with `bulk_create` and sets their primary keys, also on databases which do not
+    return them from bulk inserts. Must be called inside a transaction.
+    """
+    objs = model.objects.bulk_create(objs)
+    if objs and objs[0].pk is None:
+        # e.g. SQLite does not return the primary keys of bulk inserts, so the rows are looked up by their
+        # natural key, which is safe with concurrent writers unlike guessing the newest primary keys
+        fields = NATURAL_KEYS[model]
+        inserted = {tuple(getattr(obj, field) for field in fields): obj for obj in objs}
+        for row in model.objects.filter(**{
+            f'{field}__in': {key[position] for key in inserted} for position, field in enumerate(fields)
+        }).order_by().values_list(*fields, 'pk'):
+            if row[:-1] in inserted:
+                inserted[row[:-1]].pk = row[-1]
+    # bulk_create does not send post_save signals
+    TableVersion.objects.bump(model)
+    rows_written.send(sender=model, queryset=model.objects.filter(pk__in=[obj.pk for obj in objs]), fields=None)
+    return objs
+
+
+def find_conflicts(pairs):
+    """
+    Checks a batch of proposed appointments for double bookings with a single query,
+    which is served by the unique (employee, date) index of the appointments.
+    :param pairs: A list of (employee id, date) tuples.
+    :return: A list of dicts holding the `index`, `employee` and `date` of each conflicting pair, the id of the
+    existing `appointment` it conflicts with and the index of the earlier pair of the batch it duplicates
+    (`duplicate_of`), each None if there is none.
+    """
+    existing = {}
+    if pairs:
+        existing = {(employee_id, day): pk for employee_id, day, pk in Appointment.objects.filter(
+            employee__in={employee_id for employee_id, _ in pairs}, date__in={day for _, day in pairs}
+        ).order_by().values_list('employee', 'date', 'pk')}
+    conflicts, first = [], {}
+    for index, pair in enumerate(pairs):
+        duplicate_of = first.setdefault(pair, index)
+        if pair in existing or duplicate_of != index:
+            conflicts.append({'index': index, 'employee': pair[0], 'date': pair[1], 'appointment': existing.get(pair),
+                              'duplicate_of': duplicate_of if duplicate_of != index else None})
+    return conflicts
+
+
+class BulkWriter:
+    """
+    Validates and writes batches of objects with the given model serializer.
+    """
+    serializer_class = None
+
+    # Fields (or tuples of fields which are unique together) whose uniqueness is checked once for the whole batch
+    # instead of once per object
+    unique_fields = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        # The indexes of the new objects merged into existing ones by the last `validate` call
+        self.merged = []
+
+    @property
+    def model(self):
+        return self.serializer_class.Meta.model
+
+    def validate(self, items, partial=False, merge_duplicates=False):
+        """
+        Validates a batch of objects. The objects of partial (update) batches must contain the id of an existing object.
+        :param items: The list of objects as parsed from the request.
+        :param partial: If True, validates updates of existing objects instead of new objects.
+        :param merge_duplicates: If True, new objects violating one of the `unique_fields` are dropped instead of
+        reported as errors, i.e. merged into the existing object or the first object of the batch with the same values.
+        Their indexes are collected in `merged`.
+        :return: A list of (index, instance, validated data) tuples of the valid objects, where instance is None
+        for new objects, and a dict mapping the indexes of the invalid objects to their errors.
+        """
+        serializer = self.serializer_class(context={**self.context, 'related_objects': {}}, partial=partial)
+        self.preload_related_objects(serializer, items)
+        self.merged = []
+        for fields in self.unique_fields:
+            if isinstance(fields, str):
+                field = serializer.fields[fields]
+                field.validators = [validator for validator in field.validators
+                                    if not isinstance(validator, UniqueValidator)]
+            else:
+                serializer.validators = [validator for validator in serializer.validators
+                                         if not isinstance(validator, UniqueTogetherValidator)]
+        instances = {}
+        if partial:
+            instances = self.model.objects.in_bulk([_to_pk(item.get('id')) for item in items if isinstance(item, dict)])
+
+        valid, errors = [], {}
+        for index, item in enumerate(items):
+            instance = None
+            if partial:
+                instance = instances.get(_to_pk(item.get('id'))) if isinstance(item, dict) else None
+                if instance is None:
+                    errors[index] = {'id': ['Expected the id of an existing object.']}
+                    continue
+            serializer.instance = instance
+            try:
+                valid.append((index, instance, serializer.run_validation(item)))
+            except ValidationError as e:
+                errors[index] = e.detail
+
+        for fields in self.unique_fields:
+            self.check_unique(fields, valid, errors, merge_duplicates and not partial)
+        merged = set(self.merged)
+        return [entry for entry in valid if entry[0] not in errors and entry[0] not in merged], errors
+
+    def preload_related_objects(self, serializer, items):
+        """
+        Loads the objects referenced by the related fields of the batch with one query per field.
+        """
+        for field_name, field in serializer.fields.items():
+            if isinstance(field, CachedPrimaryKeyRelatedField) and not field.read_only:
+                pks = {_to_pk(item.get(field_name)) for item in items if isinstance(item, dict)}
+                serializer.context['related_objects'][field_name] = field.get_queryset().in_bulk(pks - {None})
+
+    def check_unique(self, fields, valid, errors, merge_duplicates=False):
+        """
+        Adds an error for each valid object whose value of the given field (or whose combination of values of the
+        given tuple of fields) is taken by another object of the batch or of the database, with a single query.
+        :param merge_duplicates: If True, adds such new objects to `merged` instead, except for the first object
+        of the batch with values which are not taken in the database.
+        """
+        field_names = (fields,) if isinstance(fields, str) else tuple(fields)
+        claims = {}
+        for index, instance, data in valid:
+            if any(field_name in data for field_name in field_names):
+                key = tuple(_to_value(data[field_name]) if field_name in data
+                            else getattr(instance, self.model._meta.get_field(field_name).attname)
+                            for field_name in field_names)
+                claims.setdefault(key, []).append((index, instance))
+        owners = {row[:-1]: row[-1] for row in self.model.objects.filter(**{
+            f'{field_name}__in': {key[position] for key in claims} for position, field_name in enumerate(field_names)
+        }).order_by().values_list(*field_names, 'pk')}
+        if isinstance(fields, str):
+            message = {fields: [f'{self.model._meta.verbose_name} with this '
+                                f'{self.model._meta.get_field(fields).verbose_name} already exists.']}
+        else:
+            message = {api_settings.NON_FIELD_ERRORS_KEY: [self.unique_together_message(field_names)]}
+        for key, claimants in claims.items():
+            owner = owners.get(key)
+            for position, (index, instance) in enumerate(claimants):
+                if len(claimants) == 1 and (owner is None or (instance is not None and owner == instance.pk)):
+                    continue
+                if not merge_duplicates or instance is not None:
+                    errors[index] = message
+                elif owner is not None or position > 0:
+                    self.merged.append(index)
+
+    def unique_together_message(self, field_names):
+        for validator in getattr(self.serializer_class.Meta, 'validators', []):
+            if isinstance(validator, UniqueTogetherValidator) and tuple(validator.fields) == field_names:
+                return validator.message.format(field_names=', '.join(field_names))
+        return f'The fields {", ".join(field_names)} must make a unique set.'
+
+    def create(self, validated_data):
+        """
+        Creates the objects of the given validated data.
+        """
+        with transaction.atomic():
+            return bulk_create_with_pks(self.model, [self.model(**data) for data in validated_data])
+
+    def update(self, changes):
+        """
+        Applies the validated data to the given instances.
+        :param changes: A list of (instance, validated data) tuples.
+        """
+        fields = set()
+        for instance, data in changes:
+            for attr, value in data.items():
+                setattr(instance, attr, value)
+            fields.update(data)
+        instances = [instance for instance, _ in changes]
+        if fields:
+            with transaction.atomic():
+                self.model.objects.bulk_update(instances, fields)
+        return instances
+
+
+class EmployeeBulkWriter(BulkWriter):
+    """
+    Writes batches of `polls.models.Employee` objects.
+    """
+    serializer_class = EmployeeSerializer
+    unique_fields = ('employee_id',)
+
+    # sets next_reminder to date_of_entry like `EmployeeSerializer.create`
+    def create(self, validated_data):
+        for data in validated_data:
+            data['next_reminder'] = data['date_of_entry']
+        return super().create(validated_data)
+
+
+class AppointmentBulkWriter(BulkWriter):
+    """
+    Writes batches of `polls.models.Appointment` objects and maintains the derived fields of their employees.
+    """
+    serializer_class = AppointmentSerializer
+    unique_fields = (('employee', 'date'),)
+
+    # sets next_reminder and reminder_interval of the employees like `AppointmentSerializer.create`
+    def create(self, validated_data):
+        with transaction.atomic():
+            appointments = super().create(validated_data)
+            employees = Employee.objects.filter(pk__in={appointment.employee_id for appointment in appointments})
+            employees.adopt_department_reminder_interval()
+            employees.refresh_appointment_dates()
+        return appointments
+
+    # recomputes next_reminder of the previous and the new employees like `AppointmentSerializer.update`
+    def update(self, changes):
+        employee_ids = {instance.employee_id for instance, _ in changes}
+        with transaction.atomic():
+            appointments = super().update(changes)
+            employee_ids.update(appointment.employee_id for appointment in appointments)
+            Employee.objects.filter(pk__in=employee_ids).refresh_appointment_dates()
+        return appointments
@@ -0,0 +1,95 @@
+"""
+This file implements streaming exports of employees and appointments as CSV or NDJSON (newline delimited JSON).
+
+Rows are fetched from the database in chunks with a server-side cursor and written as they arrive,
+so an export starts immediately and memory use does not grow with the number of rows.
+See `polls.views.ExportMixin` for the endpoints.
+"""
+
+import csv
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from polls.renderers import dumps
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson; charset=utf-8'}
+
+EXPORT_DATE_FORMAT = '%d.%m.%Y'
+
+# The exported columns as (header, lookup) pairs, foreign keys are followed with a join
+EMPLOYEE_EXPORT_COLUMNS = [
+    ('id', 'id'), ('employee_id', 'employee_id'), ('first_name', 'first_name'), ('last_name', 'last_name'),
+    ('gender', 'gender'), ('date_of_birth', 'date_of_birth'), ('date_of_entry', 'date_of_entry'),
+    ('date_of_exit', 'date_of_exit'), ('department', 'department__name'), ('wants_reminder', 'wants_reminder'),
+    ('next_reminder', 'next_reminder'), ('reminder_interval', 'reminder_interval'), ('notes', 'notes'),
+    ('active', 'active'),
+]
+
+APPOINTMENT_EXPORT_COLUMNS = [
+    ('id', 'id'), ('date', 'date'), ('confirmed', 'confirmed'), ('note', 'note'), ('employee', 'employee_id'),
+    ('employee_id', 'employee__employee_id'), ('first_name', 'employee__first_name'),
+    ('last_name', 'employee__last_name'), ('department', 'employee__department__name'),
+]
+
+
+class _Echo:
+    """
+    A file-like object returning what is written to it, so that `csv.writer` produces strings.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    return value.strftime(EXPORT_DATE_FORMAT) if hasattr(value, 'strftime') else value
+
+
+def _csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_format_value(value) for value in row])
+
+
+def _ndjson_lines(headers, rows):
+    for row in rows:
+        yield dumps(dict(zip(headers, map(_format_value, row)))) + b'\n'
+
+
+def export_lines(queryset, columns, output_format, chunk_size=None):
+    """
+    Lazily serializes the given queryset row by row.
+    :param columns: A list of (header, lookup) pairs, e.g. `EMPLOYEE_EXPORT_COLUMNS`.
+    :param output_format: One of `EXPORT_FORMATS`.
+    :param chunk_size: How many rows are fetched from the database and sent to the client at once,
+    defaults to `POLLS['EXPORT_CHUNK_SIZE']`.
+    :return: A generator of strings (CSV) or bytes (NDJSON), each holding the lines of up to `chunk_size` rows.
+    """
+    chunk_size = chunk_size or settings.POLLS.get('EXPORT_CHUNK_SIZE', 2000)
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=chunk_size)
+    if output_format == 'csv':
+        lines, separator = _csv_lines(headers, rows), ''
+    else:
+        lines, separator = _ndjson_lines(headers, rows), b''
+    # Joining the lines of a chunk saves a write to the client per row
+    while True:
+        chunk = separator.join(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_response(queryset, columns, output_format, file_name):
+    """
+    Returns a streaming response exporting the given queryset as an attachment.
+    """
+    response = StreamingHttpResponse(export_lines(queryset, columns, output_format),
+                                     content_type=EXPORT_CONTENT_TYPES[output_format])
+    response['Content-Disposition'] = f'attachment; filename="{file_name}.{output_format}"'
+    return response
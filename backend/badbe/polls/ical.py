@@ -0,0 +1,97 @@
+"""
+This file implements the iCalendar (RFC 5545) feed of appointments, which calendar apps can subscribe to.
+
+Each appointment becomes an all-day event. Appointments are fetched in chunks with a server-side cursor and
+each event is sent as soon as it is rendered, so large feeds are not built in memory.
+See `polls.views.AppointmentViewSet.ics` for the endpoint.
+"""
+
+from datetime import timedelta, timezone
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+ICS_CONTENT_TYPE = 'text/calendar; charset=utf-8'
+
+PRODUCT_ID = '-//badbe//Appointments//DE'
+
+
+def escape_text(value):
+    """
+    Escapes a TEXT property value.
+    """
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+
+
+def fold(line):
+    """
+    Folds a content line into lines of at most 75 octets (without the line break) as required by RFC 5545.
+    :return: The folded line including the terminating CRLF.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # never split a multi-byte character
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        # continuation lines start with a space, which counts towards their length
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def appointment_event(appointment, domain):
+    """
+    Renders the VEVENT of the given appointment, whose employee and department must be loaded.
+    """
+    employee = appointment.employee
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{appointment.pk}@{domain}',
+        f'DTSTAMP:{appointment.updated_at.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}',
+        f'DTSTART;VALUE=DATE:{appointment.date:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{appointment.date + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{escape_text(f"{employee.first_name} {employee.last_name} ({employee.employee_id})")}',
+        f'CATEGORIES:{escape_text(employee.department.name)}',
+        f'STATUS:{"CONFIRMED" if appointment.confirmed else "TENTATIVE"}',
+        'TRANSP:TRANSPARENT',
+    ]
+    if appointment.note:
+        lines.append(f'DESCRIPTION:{escape_text(appointment.note)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def ics_lines(queryset, domain, name='Appointments', chunk_size=None):
+    """
+    Lazily renders the given appointments as an iCalendar document.
+    :param domain: The domain making the UIDs of the events globally unique, e.g. the host of the request.
+    :param name: The name of the calendar displayed by calendar apps.
+    :param chunk_size: How many appointments are fetched from the database at once,
+    defaults to `POLLS['EXPORT_CHUNK_SIZE']`.
+    :return: A generator of strings, the header of the calendar followed by one string per event.
+    """
+    chunk_size = chunk_size or settings.POLLS.get('EXPORT_CHUNK_SIZE', 2000)
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODUCT_ID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ])
+    appointments = queryset.select_related('employee__department').only(
+        'id', 'date', 'note', 'confirmed', 'updated_at', 'employee__first_name', 'employee__last_name',
+        'employee__employee_id', 'employee__department__name')
+    for appointment in appointments.iterator(chunk_size=chunk_size):
+        yield appointment_event(appointment, domain)
+    yield 'END:VCALENDAR\r\n'
+
+
+def ics_response(queryset, domain, name='Appointments'):
+    """
+    Returns a streaming response of the given appointments as an iCalendar feed.
+    """
+    response = StreamingHttpResponse(ics_lines(queryset, domain, name), content_type=ICS_CONTENT_TYPE)
+    response['Content-Disposition'] = 'inline; filename="appointments.ics"'
+    return response
@@ -0,0 +1,183 @@
+"""
+This file implements importing employees from the CSV or NDJSON (newline delimited JSON) exports of the HR system.
+
+Rows are parsed lazily and processed in chunks, so that memory use does not grow with the size of the file.
+Employees are upserted by their `employee_id`: unknown ones are created, known ones are updated if their
+imported fields differ. Departments are given by their name. See the `import_employees` management command
+and `polls.views.EmployeeViewSet.import_file` for the entry points.
+"""
+
+import csv
+import hashlib
+import json
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from polls.bulk import bulk_create_with_pks
+from polls.models import Employee, Department
+from polls.renderers import loads
+from polls.serializers import EmployeeImportSerializer
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# The file name extensions from which the format of an import is guessed
+IMPORT_FORMAT_EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def guess_import_format(file_name):
+    """
+    Returns the import format belonging to the extension of the given file name or None.
+    """
+    for extension, input_format in IMPORT_FORMAT_EXTENSIONS.items():
+        if file_name.lower().endswith(extension):
+            return input_format
+    return None
+
+
+def read_rows(lines, input_format):
+    """
+    Lazily parses the lines of a CSV file with a header row or of an NDJSON file into dicts.
+    Lines of an NDJSON file which are no valid JSON are passed on as they are and fail validation later.
+    :param lines: An iterable of text lines, e.g. a file opened in text mode.
+    :param input_format: One of `IMPORT_FORMATS`.
+    """
+    if input_format == 'csv':
+        yield from csv.DictReader(lines)
+    elif input_format == 'ndjson':
+        for line in lines:
+            if line.strip():
+                try:
+                    yield loads(line)
+                except ValueError:
+                    yield line
+    else:
+        raise ValueError(f'Unknown import format "{input_format}", expected one of {", ".join(IMPORT_FORMATS)}.')
+
+
+def _fingerprint(values, fields):
+    return hashlib.sha1(json.dumps([values[field] for field in fields], default=str).encode('utf-8')).digest()
+
+
+class EmployeeImporter:
+    """
+    Upserts employees from an iterable of rows, see `run()`.
+    Each row is a dict mapping the fields of `polls.serializers.EmployeeImportSerializer` to their values.
+    Columns missing from a row leave the corresponding fields of existing employees untouched.
+    A dry run keeps the would-be values of the employees of earlier chunks, so that rows repeating their
+    `employee_id` in later chunks are reported like in a real import.
+    """
+
+    def __init__(self, dry_run=False, chunk_size=None):
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size or settings.POLLS.get('IMPORT_CHUNK_SIZE', 500)
+        # all departments are resolved by name with a single query
+        self.departments = Department.objects.in_bulk(field_name='name')
+        self.department_names = {department.pk: name for name, department in self.departments.items()}
+        self.serializer = EmployeeImportSerializer(context={'departments': self.departments})
+        self.summary = Counter()
+        self.dry_run_values = {}
+
+    def run(self, rows):
+        """
+        Imports the given rows chunk by chunk. Each chunk is written in its own transaction, unless this is a dry run.
+        :return: A generator yielding a record of the outcome of each row: a dict holding the row number,
+        the `action` (create, update, unchanged, skipped or error), the `employee_id`,
+        and the `changes` (field: [old value, new value]) of updates or the `errors` of invalid rows.
+        """
+        numbered_rows = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(numbered_rows, self.chunk_size))
+            if not chunk:
+                return
+            for record in self.import_chunk(chunk):
+                self.summary[record['action']] += 1
+                yield record
+
+    def clean(self, row):
+        """
+        Empty cells reset nullable and blank fields and are ignored otherwise.
+        """
+        if not isinstance(row, dict):
+            return row
+        fields = self.serializer.fields
+        cleaned = {}
+        for name, value in row.items():
+            if name not in fields:
+                continue
+            if value == '':
+                if fields[name].allow_null:
+                    value = None
+                elif not getattr(fields[name], 'allow_blank', False):
+                    continue
+            cleaned[name] = value
+        return cleaned
+
+    def import_chunk(self, chunk):
+        rows = [(number, self.clean(row)) for number, row in chunk]
+        employee_ids = {str(row.get('employee_id', '')).strip() for _, row in rows if isinstance(row, dict)}
+        columns = ['department_id' if field == 'department' else field for field in self.serializer.Meta.fields]
+        existing = {values['employee_id']: values for values in
+                    Employee.objects.filter(employee_id__in=employee_ids).order_by().values('id', *columns)}
+        existing.update((employee_id, self.dry_run_values[employee_id])
+                        for employee_id in employee_ids & self.dry_run_values.keys())
+
+        records, pending = [], {}
+        for number, row in rows:
+            current = existing.get(str(row.get('employee_id', '')).strip()) if isinstance(row, dict) else None
+            self.serializer.partial = current is not None
+            try:
+                data = self.serializer.run_validation(row)
+            except ValidationError as e:
+                records.append({'row': number, 'action': 'error',
+                                'employee_id': row.get('employee_id') if isinstance(row, dict) else None,
+                                'errors': e.detail})
+                continue
+            if 'department' in data:
+                data['department_id'] = data.pop('department').pk
+            if data['employee_id'] in pending:
+                superseded = pending[data['employee_id']][0]
+                records.append({'row': superseded, 'action': 'skipped', 'employee_id': data['employee_id'],
+                                'errors': [f'Superseded by row {number}.']})
+            pending[data['employee_id']] = (number, data, current)
+
+        created, updated, updated_fields = [], [], set()
+        for employee_id, (number, data, current) in pending.items():
+            if current is None:
+                data['next_reminder'] = data['date_of_entry']
+                created.append(Employee(**data))
+                records.append({'row': number, 'action': 'create', 'employee_id': employee_id})
+                continue
+            fields = sorted(data)
+            if _fingerprint(data, fields) == _fingerprint(current, fields):
+                records.append({'row': number, 'action': 'unchanged', 'employee_id': employee_id})
+                continue
+            changes = {self.field_name(field): [self.display(field, current[field]), self.display(field, data[field])]
+                       for field in fields if data[field] != current[field]}
+            updated.append(Employee(**{**current, **data}))
+            updated_fields.update(changes)
+            records.append({'row': number, 'action': 'update', 'employee_id': employee_id, 'changes': changes})
+
+        if self.dry_run:
+            for employee in created + updated:
+                self.dry_run_values[employee.employee_id] = {'id': employee.pk, **{
+                    column: getattr(employee, column) for column in columns}}
+        elif created or updated:
+            with transaction.atomic():
+                if created:
+                    bulk_create_with_pks(Employee, created)
+                if updated:
+                    Employee.objects.bulk_update(updated, updated_fields)
+        return sorted(records, key=lambda record: record['row'])
+
+    @staticmethod
+    def field_name(column):
+        return 'department' if column == 'department_id' else column
+
+    def display(self, field, value):
+        if field == 'department_id':
+            return self.department_names.get(value, value)
+        return value.isoformat() if hasattr(value, 'isoformat') else value
@@ -0,0 +1,138 @@
+"""
+This file implements the background queue for rendering cover letter PDFs.
+
+Jobs are stored in the `polls.models.PdfJob` table. The `run_pdf_worker` management command claims pending
+jobs, renders them in a pool of worker processes and stores the resulting documents, so that slow renders
+are not part of the request latency of the API.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from polls.models import PdfJob
+from polls.utils import cover_letter_context, init_render_worker, render_cover_letters_serially
+
+
+def submit_job(employees):
+    """
+    Queues a new job rendering the cover letters of the given employees.
+    """
+    with transaction.atomic():
+        job = PdfJob.objects.create()
+        job.employees.set(employees)
+    return job
+
+
+def claim_jobs(limit):
+    """
+    Marks up to `limit` of the oldest pending jobs as running and returns their ids.
+    A job is claimed with a conditional UPDATE, so that concurrent workers never claim the same job.
+    """
+    claimed = []
+    candidates = PdfJob.objects.filter(status=PdfJob.STATUS_PENDING).values_list('id', flat=True)[:limit]
+    for job_id in list(candidates):
+        if PdfJob.objects.filter(pk=job_id, status=PdfJob.STATUS_PENDING).update(
+                status=PdfJob.STATUS_RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1):
+            claimed.append(job_id)
+    return claimed
+
+
+def job_contexts(job_id):
+    """
+    Returns the cover letter template contexts of all employees of the given job.
+    """
+    today = timezone.now()
+    employees = PdfJob.objects.get(pk=job_id).employees.select_related('department').order_by('last_name', 'id')
+    return [cover_letter_context(employee, today) for employee in employees]
+
+
+def finish_job(job_id, pdf):
+    PdfJob.objects.filter(pk=job_id).update(status=PdfJob.STATUS_DONE, result=pdf, error='',
+                                            finished_at=timezone.now())
+
+
+def fail_job(job_id, error):
+    """
+    Queues the given job again, or marks it as failed once it has used up its attempts.
+    """
+    max_attempts = settings.POLLS.get('PDF_JOB_MAX_ATTEMPTS', 3)
+    PdfJob.objects.filter(pk=job_id, attempts__lt=max_attempts).update(status=PdfJob.STATUS_PENDING, error=str(error))
+    PdfJob.objects.filter(pk=job_id, attempts__gte=max_attempts).update(status=PdfJob.STATUS_FAILED, error=str(error),
+                                                                        finished_at=timezone.now())
+
+
+def expire_jobs():
+    """
+    Deletes finished jobs and their documents after `POLLS['PDF_JOB_EXPIRY_HOURS']`
+    and queues running jobs again which have been abandoned for `POLLS['PDF_JOB_TIMEOUT_MINUTES']`,
+    or marks them as failed once they have used up their attempts (see `fail_job`).
+    :return: The number of deleted and requeued jobs.
+    """
+    now = timezone.now()
+    expired = now - timedelta(hours=settings.POLLS.get('PDF_JOB_EXPIRY_HOURS', 24))
+    _, deleted = PdfJob.objects.filter(status__in=[PdfJob.STATUS_DONE, PdfJob.STATUS_FAILED],
+                                       finished_at__lt=expired).delete()
+    abandoned = now - timedelta(minutes=settings.POLLS.get('PDF_JOB_TIMEOUT_MINUTES', 30))
+    abandoned_jobs = PdfJob.objects.filter(status=PdfJob.STATUS_RUNNING, started_at__lt=abandoned)
+    max_attempts = settings.POLLS.get('PDF_JOB_MAX_ATTEMPTS', 3)
+    requeued = abandoned_jobs.filter(attempts__lt=max_attempts).update(status=PdfJob.STATUS_PENDING)
+    abandoned_jobs.filter(attempts__gte=max_attempts).update(status=PdfJob.STATUS_FAILED, finished_at=now,
+                                                             error='The job was abandoned by its worker.')
+    return deleted.get(PdfJob._meta.label, 0), requeued
+
+
+def run_worker(processes=None, poll_interval=1.0, once=False):
+    """
+    Processes queued jobs in a pool of worker processes. If a worker process dies, its jobs and the other jobs
+    of the pool are queued again (see `fail_job`) and the pool is replaced.
+    :param processes: The number of worker processes, defaults to `POLLS['PDF_JOB_WORKERS']`.
+    :param poll_interval: How many seconds to wait for new jobs when the queue is empty.
+    :param once: If True, returns as soon as the queue is empty instead of waiting for new jobs.
+    :return: The number of processed jobs.
+    """
+    processes = processes or settings.POLLS.get('PDF_JOB_WORKERS', 2)
+    processed = 0
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=init_render_worker)
+    running, broken = {}, False
+    try:
+        while True:
+            if broken:
+                # a worker process died, which breaks the pool and all jobs it was running
+                for job_id in running.values():
+                    fail_job(job_id, 'The worker process died.')
+                running, broken = {}, False
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=processes, initializer=init_render_worker)
+
+            expire_jobs()
+            for job_id in claim_jobs(processes - len(running)):
+                try:
+                    running[pool.submit(render_cover_letters_serially, job_contexts(job_id))] = job_id
+                except Exception as e:
+                    fail_job(job_id, e)
+                    broken = broken or isinstance(e, BrokenProcessPool)
+
+            if not running:
+                if once and not broken and not PdfJob.objects.filter(status=PdfJob.STATUS_PENDING).exists():
+                    return processed
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = running.pop(future)
+                try:
+                    finish_job(job_id, future.result())
+                except Exception as e:
+                    fail_job(job_id, e)
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                processed += 1
+    finally:
+        pool.shutdown()
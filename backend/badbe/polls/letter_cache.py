@@ -0,0 +1,144 @@
+"""
+This file implements a content-addressed file-system cache of rendered cover letters.
+
+A cached letter is stored under a hash of the template source and the template context, so editing the
+template or the employee automatically leads to a new entry, while the stale one is evicted eventually.
+The cache is capped in size and evicts the least recently used letters first.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils import timezone
+
+
+def _key_default(value):
+    # Letters are dated by day, so all letters rendered on the same day share the cache entry
+    if isinstance(value, datetime.datetime):
+        return (timezone.localtime(value) if timezone.is_aware(value) else value).date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+class LetterCache:
+    """
+    A content-addressed file-system cache with a size cap and LRU eviction.
+    The access time of an entry is tracked by its modification time.
+    Safe to use from several processes, as entries are written atomically.
+    The size of the cache is counted by each process from the writes since its last scan of the directory,
+    which only happens when the count exceeds `max_bytes`. Eviction then frees `EVICTION_HEADROOM` of the cap,
+    so that the next writes do not scan the directory again.
+    """
+    EVICTION_HEADROOM = 0.1
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # the size of the cached documents, None until the directory is scanned
+        self.size = None
+
+    def key(self, template_src, context_dict, kind):
+        """
+        Returns the cache key of the given template rendered with the given context into the given kind of document.
+        """
+        digest = hashlib.sha256(kind.encode('utf-8'))
+        with open(get_template(template_src).origin.name, 'rb') as template_file:
+            digest.update(template_file.read())
+        digest.update(json.dumps(context_dict, sort_keys=True, default=_key_default).encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.bin')
+
+    def get(self, key):
+        """
+        Returns the cached document with the given key or None.
+        """
+        try:
+            with open(self.path(key), 'rb') as entry:
+                data = entry.read()
+            os.utime(self.path(key))
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as entry:
+            entry.write(data)
+        if self.size is None:
+            self.size = sum(entry_size for _, entry_size, _ in self.entries())
+        try:
+            self.size -= os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, self.path(key))
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def get_or_render(self, template_src, context_dict, kind, render):
+        """
+        Returns the cached document or renders it with `render(template_src, context_dict)` and caches the result.
+        Results of None (failed renders) are not cached.
+        """
+        key = self.key(template_src, context_dict, kind)
+        data = self.get(key)
+        if data is None:
+            data = render(template_src, context_dict)
+            if data is not None:
+                self.put(key, data)
+        return data
+
+    def entries(self):
+        """
+        Returns (modification time, size, path) of all cached documents, least recently used first.
+        """
+        entries = []
+        with os.scandir(self.directory) as directory:
+            for entry in directory:
+                if entry.name.endswith('.bin'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Deletes the least recently used documents until the cache fits into `max_bytes` less the headroom.
+        :return: The number of deleted documents.
+        """
+        entries = self.entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * (1 - self.EVICTION_HEADROOM)
+        evicted = 0
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self.size = size
+        return evicted
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for _, _, path in self.entries():
+                os.remove(path)
+        self.size = None
+
+
+letter_cache = LetterCache(settings.POLLS.get('LETTER_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'letters')),
+                           settings.POLLS.get('LETTER_CACHE_MAX_BYTES', 256 * 1024 * 1024))
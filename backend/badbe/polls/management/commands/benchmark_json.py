@@ -0,0 +1,47 @@
+import io
+import timeit
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from polls.models import Employee
+from polls.renderers import FastJSONRenderer, FastJSONParser, orjson
+from polls.serializers import EmployeeSerializer
+
+
+class Command(BaseCommand):
+    """
+    Compares DRF's JSON renderer and parser with the ones of `polls.renderers` on a page of the employee list.
+    Does not touch the database.
+
+    Usage: python manage.py benchmark_json --employees 1000 --repeat 50
+    """
+
+    help = 'Measures rendering and parsing the employee list with the default and the fast JSON renderer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000, help='Number of employees in the list.')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of repetitions.')
+
+    def handle(self, *args, **options):
+        employees = [Employee(id=i, employee_id=str(i), first_name='Maria', last_name=f'Mustermann {i}',
+                              gender='weiblich', date_of_birth=date(1980, 1, 1), date_of_entry=date(2010, 1, 1),
+                              next_reminder=date(2021, 1, 1), notes='Bevorzugt Termine am Vormittag.',
+                              department_id=1)
+                     for i in range(options['employees'])]
+        data = EmployeeSerializer(employees, many=True).data
+        document = JSONRenderer().render(data)
+
+        self.stdout.write(f'{options["employees"]} employees, {len(document)} bytes, '
+                          f'orjson {"installed" if orjson else "not installed"}')
+        for task, default, fast in [
+                ('render', lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(data)),
+                ('parse', lambda: JSONParser().parse(io.BytesIO(document)),
+                 lambda: FastJSONParser().parse(io.BytesIO(document)))]:
+            default_time = timeit.timeit(default, number=options['repeat']) / options['repeat']
+            fast_time = timeit.timeit(fast, number=options['repeat']) / options['repeat']
+            self.stdout.write(self.style.SUCCESS(
+                f'{task}: {default_time * 1000:.2f} ms (DRF) vs {fast_time * 1000:.2f} ms (fast), '
+                f'{default_time / fast_time:.1f}x'))
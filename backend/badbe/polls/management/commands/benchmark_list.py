@@ -0,0 +1,43 @@
+import timeit
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls.models import Employee, Department
+from polls.serializers import EmployeeSerializer, LeanRowSerializer
+
+
+class Command(BaseCommand):
+    """
+    Compares serializing the employee list with `EmployeeSerializer` and with `LeanRowSerializer`,
+    including fetching the rows. The employees are created in a transaction which is rolled back afterwards.
+
+    Usage: python manage.py benchmark_list --employees 5000 --repeat 10
+    """
+
+    help = 'Measures the rows per second of the default and the lean list serialization of employees.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=5000, help='Number of employees in the list.')
+        parser.add_argument('--repeat', type=int, default=10, help='Number of repetitions.')
+
+    def handle(self, *args, **options):
+        count = options['employees']
+        with transaction.atomic():
+            department = Department.objects.create(name='Benchmark')
+            Employee.objects.bulk_create(
+                Employee(employee_id=f'benchmark-{i}', first_name='Maria', last_name=f'Mustermann {i}',
+                         gender='weiblich', date_of_birth=date(1980, 1, 1), date_of_entry=date(2010, 1, 1),
+                         next_reminder=date(2021, 1, 1), department=department) for i in range(count))
+            queryset = Employee.objects.filter(department=department)
+            lean_serializer = LeanRowSerializer(EmployeeSerializer())
+
+            for name, serialize in [
+                    ('EmployeeSerializer', lambda: EmployeeSerializer(queryset.all(), many=True).data),
+                    ('LeanRowSerializer', lambda: lean_serializer.to_representation(
+                        queryset.values_list(*lean_serializer.columns)))]:
+                seconds = timeit.timeit(serialize, number=options['repeat']) / options['repeat']
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: {seconds * 1000:.1f} ms per {count} rows, {count / seconds:,.0f} rows/s'))
+            transaction.set_rollback(True)
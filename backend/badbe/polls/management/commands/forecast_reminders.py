@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from polls.reminders import reminder_forecast
+
+
+class Command(BaseCommand):
+    """
+    Prints the projected number of reminders per department and month, see `polls.reminders.reminder_forecast`.
+
+    Usage: python manage.py forecast_reminders [--months 24]
+    """
+
+    help = 'Prints the projected number of reminders per department for each of the next months.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help='Number of months to forecast (default: 12).')
+
+    def handle(self, *args, **options):
+        forecast = reminder_forecast(options['months'])
+        rows = [(department['name'], department['reminders']) for department in forecast['departments']]
+        rows.append(('Total', forecast['total']))
+        width = max(len(name) for name, _ in rows)
+        self.stdout.write(' ' * width + ''.join(f'{month:>9}' for month in forecast['months']))
+        for name, counts in rows:
+            self.stdout.write(f'{name:<{width}}' + ''.join(f'{count:>9}' for count in counts))
+        self.stdout.write(self.style.SUCCESS(f'Projected {sum(forecast["total"])} reminders '
+                                             f'in {options["months"]} months.'))
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.importer import EmployeeImporter, IMPORT_FORMATS, guess_import_format, read_rows
+
+
+class Command(BaseCommand):
+    """
+    Upserts employees from a CSV or NDJSON export of the HR system, see `polls.importer`.
+
+    Usage: python manage.py import_employees --dry-run employees.csv
+    """
+
+    help = 'Creates or updates the employees of a CSV or NDJSON file by their employee_id.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Path of the CSV or NDJSON file.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Format of the file (default: by its extension).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the changes without writing them.')
+        parser.add_argument('--chunk-size', type=int, help='Number of rows written per transaction.')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or guess_import_format(options['input'])
+        if input_format is None:
+            raise CommandError(f'Cannot guess the format of {options["input"]}, use --format.')
+
+        importer = EmployeeImporter(dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+        with open(options['input'], encoding='utf-8-sig', newline='') as lines:
+            for record in importer.run(read_rows(lines, input_format)):
+                if record['action'] == 'error':
+                    self.stderr.write(f'Row {record["row"]}: {json.dumps(record["errors"])}')
+                elif record['action'] != 'unchanged' and (options['dry_run'] or options['verbosity'] > 1):
+                    self.stdout.write(json.dumps(record))
+
+        summary = ', '.join(f'{count} {action}' for action, count in sorted(importer.summary.items()))
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}Imported {sum(importer.summary.values())} rows ({summary}).'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import Tombstone
+
+
+class Command(BaseCommand):
+    """
+    Deletes the records of deleted objects older than `POLLS['TOMBSTONE_RETENTION_DAYS']`, see
+    `polls.models.TombstoneManager.prune`. Meant to be run nightly, e.g. by cron.
+
+    Usage: python manage.py prune_tombstones
+    """
+
+    help = 'Deletes the records of deleted objects which are older than the retention window of delta synchronization.'
+
+    def handle(self, *args, **options):
+        deleted = Tombstone.objects.prune()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} records of deleted objects.'))
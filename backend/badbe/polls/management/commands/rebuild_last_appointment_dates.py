@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls.models import Employee
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the denormalized `polls.models.Employee.last_appointment_date` column from the appointment table.
+
+    Usage: python manage.py rebuild_last_appointment_dates
+    """
+
+    help = 'Rebuilds the last_appointment_date column of all employees from their appointments.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = Employee.objects.all().refresh_last_appointment_date()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt last_appointment_date of {count} employees.'))
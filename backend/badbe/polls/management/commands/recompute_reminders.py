@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.reminders import recompute_next_reminders
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the `polls.models.Employee.next_reminder` column of all employees, see
+    `polls.reminders.recompute_next_reminders`. Meant to be run nightly, e.g. by cron.
+
+    Usage: python manage.py recompute_reminders
+    """
+
+    help = 'Recomputes the next reminder of all employees from their latest appointment and reminder interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Number of employees updated per transaction.')
+        parser.add_argument('--rebuild-last-appointment-dates', action='store_true',
+                            help='Recompute the latest appointment dates from the appointment table first.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        changed = recompute_next_reminders(chunk_size=options['chunk_size'],
+                                           rebuild_last_appointment_dates=options['rebuild_last_appointment_dates'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Changed the next reminder of {changed} employees in {time.monotonic() - started:.1f}s.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.stats import reconcile_department_stats, refresh_department_stats
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the `polls.models.DepartmentStats` of all departments, see `polls.stats.reconcile_department_stats`.
+    Meant to be run nightly, e.g. by cron, so that the counters refer to the new day before they are read,
+    and with `--stale` every few minutes to rebuild the counters marked stale by set-based writes.
+
+    Usage: python manage.py reconcile_department_stats [--stale]
+    """
+
+    help = 'Rebuilds the employee and appointment counters of all departments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', action='store_true',
+                            help='Only rebuild the counters which are missing, stale or refer to another day.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stats = refresh_department_stats() if options['stale'] else reconcile_department_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the statistics of {len(stats)} departments in {time.monotonic() - started:.1f}s.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.serializers import CoverLetterBatchSerializer
+from polls.utils import render_cover_letters_to_pdf
+
+
+class Command(BaseCommand):
+    """
+    Renders the cover letters of several employees in parallel and merges them into one PDF file.
+
+    Usage: python manage.py render_cover_letters --reminder-after 2020-01-01 --reminder-before 2020-01-31 letters.pdf
+    """
+
+    help = 'Renders the cover letters of the selected employees into one PDF file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the merged PDF file.')
+        parser.add_argument('--employees', nargs='+', type=int, help='Internal ids of the employees.')
+        parser.add_argument('--reminder-after', help='Select employees whose next reminder is on or after this date.')
+        parser.add_argument('--reminder-before', help='Select employees whose next reminder is on or before this date.')
+        parser.add_argument('--workers', type=int, help='Number of worker processes (default: one per CPU).')
+
+    def handle(self, *args, **options):
+        selection = {key: options[key] for key in ['employees', 'reminder_after', 'reminder_before'] if options[key]}
+        serializer = CoverLetterBatchSerializer(data=selection)
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+        employees = list(serializer.selected_employees())
+        if not employees:
+            raise CommandError('No employees match the selection.')
+
+        pdf, failed = render_cover_letters_to_pdf(employees, max_workers=options['workers'])
+        if failed:
+            self.stderr.write(f'Failed to render the letters of employees {", ".join(map(str, failed))}.')
+        if pdf is None:
+            raise CommandError('No letter could be rendered.')
+
+        with open(options['output'], 'wb') as output:
+            output.write(pdf)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {len(employees) - len(failed)} letters to {options["output"]}.'))
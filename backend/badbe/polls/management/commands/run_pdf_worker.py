@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from polls.jobs import run_worker
+
+
+class Command(BaseCommand):
+    """
+    Processes the queued cover letter PDF jobs (see `polls.jobs`).
+
+    Usage: python manage.py run_pdf_worker [--processes 4] [--once]
+    """
+
+    help = 'Renders queued cover letter PDF jobs in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            help="Number of worker processes (default: POLLS['PDF_JOB_WORKERS']).")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait for new jobs when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit as soon as the queue is empty instead of waiting for new jobs.')
+
+    def handle(self, *args, **options):
+        processed = run_worker(processes=options['processes'], poll_interval=options['poll_interval'],
+                               once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs.'))
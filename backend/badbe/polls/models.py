@@ -9,7 +9,15 @@ https://docs.djangoproject.com/en/3.0/topics/db/models/
 """
 
 
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, Count, F, Func, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+from django.utils import timezone
+from monthdelta import monthdelta
 from django.contrib.auth.models import User, AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 # Note: Instead of referring to User directly, you should reference the user model using
@@ -20,6 +28,35 @@ from django.contrib.auth.models import User, AbstractBaseUser, BaseUserManager,
 CHARFIELD_DEFAULT_MAX_LENGTH = 255
 
 
+class AddMonths(Func):
+    """
+    A database function adding a number of months to a date like `monthdelta`,
+    i.e. the day is clamped to the last day of the resulting month.
+    """
+    arity = 2
+    output_field = models.DateField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        date_sql, date_params = compiler.compile(self.source_expressions[0])
+        months_sql, months_params = compiler.compile(self.source_expressions[1])
+        month_sql = f"date({date_sql}, 'start of month', ({months_sql}) || ' months')"
+        # note that || binds stronger than + and - in SQLite
+        last_day_sql = f"CAST(strftime('%%d', date({date_sql}, 'start of month', (({months_sql}) + 1) || ' months', " \
+                       f"'-1 day')) AS integer)"
+        day_sql = f"CAST(strftime('%%d', {date_sql}) AS integer)"
+        sql = f"date({month_sql}, (min({day_sql}, {last_day_sql}) - 1) || ' days')"
+        params = date_params + months_params + date_params + date_params + months_params
+        return sql, params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='(%(expressions)s))::date',
+                           arg_joiner=' + make_interval(months => ', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATE_ADD(%(expressions)s MONTH)',
+                           arg_joiner=', INTERVAL ', **extra_context)
+
+
 class Department(models.Model):
     """
     A model containing the essential fields and behaviors of a business department.
@@ -40,6 +77,115 @@ class Department(models.Model):
         return self.name
 
 
+def reminder_interval_expression():
+    """
+    Returns an expression of the reminder interval applying to an employee like `Employee.applicable_reminder_interval`.
+    The department is read with a subquery, as UPDATE statements cannot join it.
+    """
+    department_interval = Department.objects.filter(pk=OuterRef('department_id')).values('reminder_interval')[:1]
+    return Case(When(reminder_interval__gt=0, then=F('reminder_interval')), default=Subquery(department_interval),
+                output_field=models.IntegerField())
+
+
+def next_reminder_expression(interval=None):
+    """
+    Returns an expression deriving `Employee.next_reminder` like `Employee.derive_next_reminder`,
+    optionally with another reminder interval.
+    """
+    if interval is None:
+        interval = reminder_interval_expression()
+    return Case(When(last_appointment_date__isnull=True, then=F('date_of_entry')),
+                default=AddMonths(F('last_appointment_date'), interval), output_field=models.DateField())
+
+
+# Sent by set-based writes, which do not send post_save for each row: by `TimestampedQuerySet.update` before the
+# update (with the updated fields) and by `polls.bulk.bulk_create_with_pks` after the insert (without fields).
+# The queryset argument selects the written rows.
+rows_written = Signal()
+
+
+class TimestampedQuerySet(models.QuerySet):
+    """
+    A custom queryset for models with an `updated_at` field.
+    Unlike `save()`, `QuerySet.update()` does not apply `auto_now`, so it is stamped here.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        rows_written.send(sender=self.model, queryset=self, fields=set(kwargs))
+        updated = super().update(**kwargs)
+        if updated:
+            TableVersion.objects.bump(self.model)
+        return updated
+
+
+class EmployeeQuerySet(TimestampedQuerySet):
+    """
+    A custom queryset providing set-based maintenance of denormalized employee fields.
+    """
+
+    def record_appointment_date(self, date):
+        """
+        Advances `last_appointment_date` to the given date wherever it is later than the stored one.
+        Runs a single UPDATE statement and does not read the appointment table.
+        """
+        return self.update(last_appointment_date=Greatest(Coalesce(F('last_appointment_date'), Value(date)),
+                                                          Value(date)))
+
+    def refresh_last_appointment_date(self):
+        """
+        Recomputes `last_appointment_date` from the appointment table with a single UPDATE statement.
+        """
+        latest = Appointment.objects.filter(employee=OuterRef('pk')).order_by('-date').values('date')[:1]
+        return self.update(last_appointment_date=Subquery(latest))
+
+    def refresh_appointment_dates(self):
+        """
+        Recomputes `last_appointment_date` and the derived `next_reminder` after appointments were modified.
+        Should be called inside the transaction that modified the appointments.
+        """
+        self.refresh_last_appointment_date()
+        self.recompute_next_reminder()
+
+    def recompute_next_reminder(self):
+        """
+        Sets `next_reminder` to the value derived by `Employee.derive_next_reminder` with a single UPDATE statement.
+        Only rows whose value changes are written.
+        :return: The number of changed rows.
+        """
+        next_reminder = next_reminder_expression()
+        return self.exclude(next_reminder=next_reminder).update(next_reminder=next_reminder)
+
+    def cascade_reminder_interval(self, previous_interval, interval):
+        """
+        Sets the reminder interval of the employees following their department's `previous_interval`
+        (the others have an individual interval) to `interval` and recomputes their `next_reminder`,
+        with a single UPDATE statement.
+        :return: The number of updated employees.
+        """
+        return self.filter(reminder_interval=previous_interval).update(
+            reminder_interval=interval, next_reminder=next_reminder_expression(Value(interval)))
+
+    def preview_reminder_interval(self, previous_interval, interval):
+        """
+        Returns how `cascade_reminder_interval` would change the employees, as a dict holding the number of
+        updated employees and the number of next reminders moving `earlier`, `later` or being set for the first time.
+        """
+        next_reminder = next_reminder_expression(Value(interval))
+        return self.filter(reminder_interval=previous_interval).annotate(new_next_reminder=next_reminder).aggregate(
+            employees=Count('id'),
+            earlier=Count('id', filter=Q(next_reminder__gt=F('new_next_reminder'))),
+            later=Count('id', filter=Q(next_reminder__lt=F('new_next_reminder'))),
+            unset=Count('id', filter=Q(next_reminder__isnull=True)))
+
+    def adopt_department_reminder_interval(self):
+        """
+        Sets `reminder_interval` to the one of the employee's department with a single UPDATE statement.
+        """
+        interval = Department.objects.filter(pk=OuterRef('department_id')).values('reminder_interval')[:1]
+        return self.update(reminder_interval=Subquery(interval))
+
+
 class Employee(models.Model):
     """
     A model containing the essential fields and behaviors of an employee.
@@ -47,6 +193,16 @@ class Employee(models.Model):
 
     class Meta:
         ordering = ['last_name']
+        indexes = [
+            # Serves the default ordering and keyset pagination (`polls.pagination.KeysetPagination`)
+            models.Index(fields=['last_name', 'id'], name='employee_last_name_idx'),
+            # Serves the dashboard query (`EmployeeFilter`: active, wants_reminder, reminder_after/reminder_before)
+            models.Index(fields=['active', 'wants_reminder', 'next_reminder'], name='employee_due_idx'),
+            # Serves reminder range queries that do not filter on the flags
+            models.Index(fields=['next_reminder'], name='employee_next_reminder_idx'),
+        ]
+
+    objects = EmployeeQuerySet.as_manager()
 
     GENDER_CHOICES = (
         ('männlich', 'männlich'),
@@ -79,6 +235,9 @@ class Employee(models.Model):
     # Date on which the next reminder will be displayed
     next_reminder = models.DateField(blank=True, null=True)
 
+    # Date of the employee's latest appointment, maintained on appointment writes
+    last_appointment_date = models.DateField(blank=True, null=True)
+
     # Whether this employee record represents an ongoing employment relationship or an archived one
     active = models.BooleanField(default=True)
 
@@ -88,9 +247,28 @@ class Employee(models.Model):
     # The interval at which appointment reminders are to be displayed for the employee
     reminder_interval = models.IntegerField(default=24)
 
+    # Designates when the record was last modified, used for delta synchronization
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     def __str__(self):
         return " ".join([self.first_name, self.last_name])
 
+    def applicable_reminder_interval(self):
+        """
+        Returns the reminder interval applying to the employee: their own `reminder_interval`,
+        or the one of their department if they have none (0 or less).
+        """
+        return self.reminder_interval if self.reminder_interval > 0 else self.department.reminder_interval
+
+    def derive_next_reminder(self):
+        """
+        Returns the date of the next reminder: the latest appointment plus the applicable reminder interval,
+        or the first day of employment if there has not been an appointment yet.
+        """
+        if self.last_appointment_date is None:
+            return self.date_of_entry
+        return self.last_appointment_date + monthdelta(months=self.applicable_reminder_interval())
+
 
 class Appointment(models.Model):
     """
@@ -99,6 +277,17 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['date']
+        constraints = [
+            # Prevents double bookings. Its index also serves `AppointmentFilter` (employee + min_date/max_date),
+            # the latest appointment lookup per employee and the conflict check of `polls.bulk.find_conflicts`
+            models.UniqueConstraint(fields=['employee', 'date'], name='appointment_employee_date_unique'),
+        ]
+        indexes = [
+            # Serves date range queries across all employees, the default ordering and keyset pagination
+            models.Index(fields=['date', 'id'], name='appointment_date_idx'),
+        ]
+
+    objects = TimestampedQuerySet.as_manager()
 
     # Date of the appointment
     date = models.DateField()
@@ -111,6 +300,9 @@ class Appointment(models.Model):
 
     confirmed = models.BooleanField(default=False)
 
+    # Designates when the record was last modified, used for delta synchronization
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
 
 class Template(models.Model):
     """
@@ -120,10 +312,171 @@ class Template(models.Model):
     class Meta:
         ordering = ['name']
 
+    objects = TimestampedQuerySet.as_manager()
+
     name = models.CharField(max_length=CHARFIELD_DEFAULT_MAX_LENGTH)
     description = models.TextField(blank=True, default='')
     template_body = models.TextField(blank=True, default='')
 
+    # Designates when the record was last modified, used for delta synchronization
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class TombstoneManager(models.Manager):
+    """
+    A custom manager for the Tombstone model.
+    """
+
+    def retained_since(self):
+        """
+        Returns the time since which the deletions are recorded, see `POLLS['TOMBSTONE_RETENTION_DAYS']`.
+        """
+        return timezone.now() - timedelta(days=settings.POLLS.get('TOMBSTONE_RETENTION_DAYS', 30))
+
+    def prune(self):
+        """
+        Deletes the records older than the retention window.
+        :return: The number of deleted records.
+        """
+        deleted, _ = self.filter(deleted_at__lt=self.retained_since()).delete()
+        return deleted
+
+
+class Tombstone(models.Model):
+    """
+    A model recording the deletion of an employee, appointment or template, used for delta synchronization.
+    The records are kept for `POLLS['TOMBSTONE_RETENTION_DAYS']`, see the `prune_tombstones` command.
+    """
+
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_idx'),
+        ]
+
+    # The label of the deleted object's model, e.g. 'polls.Employee'
+    model = models.CharField(max_length=CHARFIELD_DEFAULT_MAX_LENGTH)
+
+    # The primary key of the deleted object
+    object_id = models.IntegerField()
+
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TombstoneManager()
+
+
+class DepartmentStats(models.Model):
+    """
+    A model containing counters of the employees and appointments of a department, so that department overviews
+    do not have to count them. They are maintained incrementally by the signal handlers in `polls.signals` and
+    rebuilt by `polls.stats.reconcile_department_stats` once they are stale.
+    """
+
+    department = models.OneToOneField(Department, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+
+    # The number of active employees
+    active_employees = models.IntegerField(default=0)
+
+    # The number of active employees who want to be reminded and whose next reminder lies within
+    # `POLLS['NOTIFY_APPOINTMENT_AHEAD']` days from computed_on
+    due_soon = models.IntegerField(default=0)
+
+    # The number of active employees who want to be reminded and whose next reminder lies before computed_on
+    overdue = models.IntegerField(default=0)
+
+    # The number of appointments of the employees in the year of computed_on
+    appointments_this_year = models.IntegerField(default=0)
+
+    # The day the counters refer to, they are stale on any other day
+    computed_on = models.DateField(null=True)
+
+    # Designates that the counters missed set-based writes, see `rows_written`
+    stale = models.BooleanField(default=False)
+
+
+class TableVersionManager(models.Manager):
+    """
+    A custom manager for the TableVersion model.
+    """
+
+    def bump(self, *model_classes):
+        """
+        Increments the version counters of the given models.
+        """
+        now = timezone.now()
+        for model_class in model_classes:
+            label = model_class._meta.label
+            if not self.filter(model=label).update(version=F('version') + 1, updated_at=now):
+                self.get_or_create(model=label)
+
+    def versions(self, *model_classes):
+        """
+        Returns a dict mapping the labels of the given models to their (version, updated_at) tuples.
+        """
+        labels = [model_class._meta.label for model_class in model_classes]
+        return {model: (version, updated_at) for model, version, updated_at in
+                self.filter(model__in=labels).values_list('model', 'version', 'updated_at')}
+
+
+class TableVersion(models.Model):
+    """
+    A model containing a version counter per model (database table), which is incremented on every write
+    to that table. Used to answer conditional GET requests without querying the table itself.
+    """
+
+    objects = TableVersionManager()
+
+    # The label of the versioned model, e.g. 'polls.Employee'
+    model = models.CharField(max_length=CHARFIELD_DEFAULT_MAX_LENGTH, unique=True)
+
+    version = models.BigIntegerField(default=1)
+
+    # Designates when the table was last modified
+    updated_at = models.DateTimeField(default=timezone.now)
+
+
+class PdfJob(models.Model):
+    """
+    A model containing the essential fields and behaviors of a background job rendering cover letters into a PDF.
+    Jobs are processed by the `run_pdf_worker` management command, see `polls.jobs`.
+    """
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Serves claiming the oldest pending jobs and expiring finished ones
+            models.Index(fields=['status', 'created_at'], name='pdfjob_status_idx'),
+        ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, STATUS_PENDING),
+        (STATUS_RUNNING, STATUS_RUNNING),
+        (STATUS_DONE, STATUS_DONE),
+        (STATUS_FAILED, STATUS_FAILED),
+    )
+    status = models.CharField(max_length=CHARFIELD_DEFAULT_MAX_LENGTH, choices=STATUS_CHOICES,
+                              default=STATUS_PENDING)
+
+    # The employees whose cover letters are rendered
+    employees = models.ManyToManyField(Employee)
+
+    # How often rendering has been attempted
+    attempts = models.IntegerField(default=0)
+
+    # The error message of the last failed attempt
+    error = models.TextField(blank=True, default='')
+
+    # The rendered PDF document
+    result = models.BinaryField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
 
 class AccountManager(BaseUserManager):
     """
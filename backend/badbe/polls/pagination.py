@@ -0,0 +1,137 @@
+"""
+This file defines the pagination styles used in this project.
+
+For more information, see
+https://www.django-rest-framework.org/api-guide/pagination/
+"""
+
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, LimitOffsetPagination
+
+
+class OffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination, e.g. `?pagination=offset&limit=100&offset=400`.
+    """
+    default_limit = 200
+    max_limit = 1000
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination ordered by the model's `Meta.ordering` with `id` as tie-break, so that
+    each page is fetched with an index range scan no matter how deep it is.
+
+    Unlike `CursorPagination`, whose position is the value of the first ordering field plus an offset within
+    the rows sharing it, the cursor holds the values of all ordering fields of the last (or first) row of the
+    page, so that pages never skip rows with equal values. The ordering fields must not be nullable.
+
+    Clients that need to jump to arbitrary pages (e.g. the archive screen) can opt in to
+    limit/offset pagination with `?pagination=offset`.
+    """
+    page_size = 200
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    mode_query_param = 'pagination'
+    offset_pagination_class = OffsetPagination
+
+    offset_paginator = None
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.model._meta.ordering)
+        if 'id' not in ordering:
+            ordering += ('id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == 'offset':
+            self.offset_paginator = self.offset_pagination_class()
+            queryset = queryset.order_by(*self.get_ordering(request, queryset, view))
+            return self.offset_paginator.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        ordering = tuple(_invert(field) for field in self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor and self.cursor.position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(queryset.model, ordering, self.cursor.position))
+
+        # one more row tells whether there is a further page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        moved = bool(self.cursor and self.cursor.position is not None)
+        self.has_next = moved if reverse else has_more
+        self.has_previous = has_more if reverse else moved
+        return self.page
+
+    def get_keyset_filter(self, model, ordering, position):
+        """
+        Returns the condition selecting the rows which come after the given position in the given ordering,
+        e.g. `last_name > x OR (last_name = x AND id > y)`.
+        """
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            values = [model._meta.get_field(field.lstrip('-')).to_python(value)
+                      for field, value in zip(ordering, values)]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        conditions = []
+        for i, field in enumerate(ordering):
+            equal = {name.lstrip('-'): value for name, value in zip(ordering[:i], values[:i])}
+            lookup = '{}__{}'.format(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt')
+            conditions.append(Q(**equal, **{lookup: values[i]}))
+        return reduce(or_, conditions)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.page[-1] if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._encode_position(position)))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.page[0] if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._encode_position(position)))
+
+    def _encode_position(self, instance):
+        if instance is None:
+            # an empty page, e.g. after deletions, links to the first and last page
+            return None
+        values = []
+        for field in self.ordering:
+            field = field.lstrip('-')
+            value = instance[field] if isinstance(instance, dict) else getattr(instance, field)
+            values.append(value if isinstance(value, (int, float)) or value is None else str(value))
+        return json.dumps(values, separators=(',', ':'))
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.offset_paginator:
+            return self.offset_paginator.to_html()
+        return super().to_html()
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else '-' + field
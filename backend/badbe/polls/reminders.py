@@ -0,0 +1,118 @@
+"""
+This file implements the reminder logic of this project, i.e. determining which employees are due
+for an occupational health appointment.
+"""
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from polls.models import Appointment, Department, Employee, TableVersion, reminder_interval_expression
+
+# The fields needed by the dashboard to display and hide due reminders
+DUE_REMINDER_FIELDS = ['id', 'employee_id', 'first_name', 'last_name', 'department', 'next_reminder',
+                       'reminder_interval']
+
+
+def due_reminders_queryset(today=None):
+    """
+    Returns the active employees who want to be reminded and whose next reminder lies within
+    `POLLS['NOTIFY_APPOINTMENT_AHEAD']` days before or after today, most urgent first.
+    The query is served by the `employee_due_idx` index, including the ordering.
+    """
+    today = today or timezone.localdate()
+    ahead = timedelta(days=settings.POLLS['NOTIFY_APPOINTMENT_AHEAD'])
+    return Employee.objects.filter(active=True, wants_reminder=True,
+                                   next_reminder__gte=today - ahead, next_reminder__lte=today + ahead) \
+        .order_by('next_reminder', 'id')
+
+
+def due_reminders(today=None):
+    """
+    Returns the due reminders as a list of dicts holding the `DUE_REMINDER_FIELDS`.
+    The result is cached per day until the next write to the employee table (see `polls.models.TableVersion`).
+    """
+    today = today or timezone.localdate()
+    version, _ = TableVersion.objects.versions(Employee).get(Employee._meta.label, (0, None))
+    key = f'polls:due-reminders:{today.isoformat()}:{version}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(due_reminders_queryset(today).values(*DUE_REMINDER_FIELDS))
+        for row in rows:
+            row['next_reminder'] = row['next_reminder'].strftime('%d.%m.%Y')
+        cache.set(key, rows, timeout=24 * 60 * 60)
+    return rows
+
+
+def reminder_forecast(months=12, start=None):
+    """
+    Projects how many reminders fall into each of the next months per department, assuming every employee keeps
+    their cycle: a reminder on `next_reminder` and then every `Employee.applicable_reminder_interval` months.
+    Overdue reminders are counted in the first month and their cycle continues from there.
+    The employees are counted per department, month of the next reminder and interval with one grouped query,
+    so the cycles are projected for a few hundred groups instead of for each employee.
+    The result is cached until the next write to the employee, appointment or department table.
+    :param months: The number of months of the forecast.
+    :param start: A date within the first month of the forecast, defaults to today.
+    :return: A dict holding the `months` ("MM.YYYY"), the `departments` (id, name and the number of `reminders`
+    per month) and the `total` number of reminders per month.
+    """
+    start = (start or timezone.localdate()).replace(day=1)
+    versions = TableVersion.objects.versions(Employee, Appointment, Department)
+    key = f'polls:reminder-forecast:{start.isoformat()}:{months}:' + ':'.join(
+        str(versions.get(model._meta.label, (0, None))[0]) for model in (Employee, Appointment, Department))
+    forecast = cache.get(key)
+    if forecast is not None:
+        return forecast
+
+    first = start.year * 12 + start.month - 1
+    end = date((first + months) // 12, (first + months) % 12 + 1, 1)
+    groups = Employee.objects.filter(active=True, wants_reminder=True, next_reminder__lt=end).order_by() \
+        .values('department', year=ExtractYear('next_reminder'), month=ExtractMonth('next_reminder'),
+                cycle=reminder_interval_expression()) \
+        .annotate(count=Count('id'))
+    reminders = {}
+    for group in groups:
+        offset = max(group['year'] * 12 + group['month'] - 1 - first, 0)
+        counts = reminders.setdefault(group['department'], [0] * months)
+        for month in range(offset, months, group['cycle'] if group['cycle'] and group['cycle'] > 0 else months):
+            counts[month] += group['count']
+
+    departments = Department.objects.in_bulk(list(reminders))
+    forecast = {
+        'months': [f'{(first + month) % 12 + 1:02d}.{(first + month) // 12}' for month in range(months)],
+        'departments': sorted(({'id': pk, 'name': departments[pk].name, 'reminders': counts}
+                               for pk, counts in reminders.items()), key=lambda department: department['name']),
+        'total': [sum(counts[month] for counts in reminders.values()) for month in range(months)],
+    }
+    cache.set(key, forecast, timeout=24 * 60 * 60)
+    return forecast
+
+
+def recompute_next_reminders(chunk_size=None, rebuild_last_appointment_dates=False):
+    """
+    Recomputes `next_reminder` of all employees from their latest appointment and their reminder interval.
+    The employees are processed in chunks of primary keys, each with one set-based UPDATE in its own transaction,
+    so that concurrent requests are not blocked for long. Only rows whose value changes are written.
+    :param chunk_size: The number of primary keys per chunk, defaults to `POLLS['REMINDER_CHUNK_SIZE']`.
+    :param rebuild_last_appointment_dates: If True, first recomputes `last_appointment_date` from the
+    appointment table, in case it has been modified bypassing the API.
+    :return: The number of employees whose next reminder changed.
+    """
+    chunk_size = chunk_size or settings.POLLS.get('REMINDER_CHUNK_SIZE', 20000)
+    bounds = Employee.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+    changed = 0
+    for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        with transaction.atomic():
+            employees = Employee.objects.filter(pk__gte=start, pk__lt=start + chunk_size)
+            if rebuild_last_appointment_dates:
+                employees.refresh_last_appointment_date()
+            changed += employees.recompute_next_reminder()
+    return changed
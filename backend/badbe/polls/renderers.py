@@ -0,0 +1,108 @@
+"""
+This file defines the JSON renderer and parser used by the API of this project.
+
+They are drop-in replacements of DRF's `JSONRenderer` and `JSONParser` which use orjson if it is installed
+and fall back to the standard library otherwise. Dates which have not been formatted by a serializer field
+are rendered in the "%d.%m.%Y" format of the serializers.
+
+For more information, see
+https://www.django-rest-framework.org/api-guide/renderers/
+https://www.django-rest-framework.org/api-guide/parsers/
+"""
+
+import datetime
+import json
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder as BaseJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATE_FORMAT = '%d.%m.%Y'
+
+
+class JSONEncoder(BaseJSONEncoder):
+    """
+    DRF's JSON encoder rendering dates in `DATE_FORMAT`.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, datetime.date) and not isinstance(obj, datetime.datetime):
+            return obj.strftime(DATE_FORMAT)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+
+def _orjson_default(obj):
+    # orjson passes dates and datetimes here (OPT_PASSTHROUGH_DATETIME), lazy strings etc. are handled by DRF
+    return _encoder.default(obj)
+
+
+def dumps(data):
+    """
+    Serializes the given data into compact UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_orjson_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """
+    Deserializes the given JSON document (bytes or str).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    Renders compact JSON with `dumps`. Indented output (e.g. `; indent=4` in the Accept header)
+    is rendered by DRF with the same encoder.
+    """
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like DRF, escape the line separators that are valid JSON but invalid JavaScript
+        return dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    Parses JSON request bodies with `loads`.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            return loads(data if encoding.lower().replace('-', '') == 'utf8' else data.decode(encoding))
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class ICalendarRenderer(renderers.BaseRenderer):
+    """
+    Lets calendar apps request `text/calendar`. The feed itself is streamed by `polls.ical`,
+    so this renderer only renders errors, as JSON.
+    """
+    media_type = 'text/calendar'
+    format = 'ics'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b'' if data is None else dumps(data)
@@ -0,0 +1,111 @@
+"""
+This file implements automatic scheduling of appointments for the employees whose reminder is due.
+
+The employees are assigned greedily by urgency (earliest `next_reminder` first) to the earliest day with free
+capacity, but not before their reminder is displayed (`POLLS['NOTIFY_APPOINTMENT_AHEAD']` days ahead).
+Existing appointments use up the capacity of their day, and employees who already have an upcoming appointment
+are skipped. See `polls.views.AppointmentViewSet.schedule` for the endpoint.
+"""
+
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+
+from polls.bulk import AppointmentBulkWriter
+from polls.models import Appointment, Employee
+
+
+class DaySlots:
+    """
+    The free capacity of a sorted list of days with an index of the next day with free capacity
+    (a disjoint-set forest with path compression), so that finding a slot takes amortized constant time
+    no matter how many days are already full.
+    """
+
+    def __init__(self, days, capacities):
+        self.days = days
+        self.free = list(capacities)
+        # next_free[i] leads to the first day on or after day i with free capacity, len(days) means none
+        self.next_free = [i if free > 0 else i + 1 for i, free in enumerate(self.free)] + [len(days)]
+
+    def find(self, index):
+        root = index
+        while self.next_free[root] != root:
+            root = self.next_free[root]
+        while self.next_free[index] != root:
+            self.next_free[index], index = root, self.next_free[index]
+        return root
+
+    def take(self, earliest):
+        """
+        Takes a slot on the first day with free capacity on or after the given date.
+        :return: The day of the slot or None if all following days are full.
+        """
+        index = self.find(bisect_left(self.days, earliest))
+        if index == len(self.days):
+            return None
+        self.free[index] -= 1
+        if self.free[index] == 0:
+            self.next_free[index] = index + 1
+        return self.days[index]
+
+
+def schedulable_days(start, end, weekdays=None):
+    """
+    Returns the days from start to end (inclusive) which fall on one of the given weekdays
+    (0 is Monday), defaults to `POLLS['SCHEDULER_WEEKDAYS']`.
+    """
+    weekdays = settings.POLLS.get('SCHEDULER_WEEKDAYS', (0, 1, 2, 3, 4)) if weekdays is None else weekdays
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)
+            if (start + timedelta(days=offset)).weekday() in weekdays]
+
+
+def due_employees(start, reminder_before, reminder_after=None, department=None):
+    """
+    Returns the ids and next reminders of the active employees who want to be reminded, whose next reminder
+    lies within the given range and who have no appointment on or after start, most urgent first.
+    """
+    upcoming = Appointment.objects.filter(employee=OuterRef('pk'), date__gte=start)
+    employees = Employee.objects.filter(~Exists(upcoming), active=True, wants_reminder=True,
+                                        next_reminder__lte=reminder_before)
+    if reminder_after:
+        employees = employees.filter(next_reminder__gte=reminder_after)
+    if department:
+        employees = employees.filter(department=department)
+    return employees.order_by('next_reminder', 'id').values_list('id', 'next_reminder')
+
+
+def schedule_appointments(start, end, capacity, reminder_before=None, reminder_after=None, department=None,
+                          dry_run=False):
+    """
+    Schedules appointments for the due employees between start and end.
+    :param capacity: The maximum number of appointments per day, including existing ones.
+    :param reminder_before: Only employees whose next reminder is on or before this date are scheduled,
+    defaults to end.
+    :param reminder_after: Only employees whose next reminder is on or after this date are scheduled.
+    :param department: Only employees of this department are scheduled.
+    :param dry_run: If True, only plans the appointments without creating them.
+    :return: A list of (employee id, date) tuples of the planned appointments
+    and a list of the ids of the due employees for whom no slot was left.
+    """
+    days = schedulable_days(start, end)
+    booked = dict(Appointment.objects.filter(date__gte=start, date__lte=end).order_by()
+                  .values_list('date').annotate(count=Count('id')))
+    slots = DaySlots(days, [capacity - booked.get(day, 0) for day in days])
+    ahead = timedelta(days=settings.POLLS['NOTIFY_APPOINTMENT_AHEAD'])
+
+    planned, unscheduled = [], []
+    for employee_id, next_reminder in due_employees(start, reminder_before or end, reminder_after, department):
+        day = slots.take(max(start, next_reminder - ahead))
+        if day is None:
+            unscheduled.append(employee_id)
+        else:
+            planned.append((employee_id, day))
+
+    if planned and not dry_run:
+        with transaction.atomic():
+            AppointmentBulkWriter().create([{'employee_id': employee_id, 'date': day} for employee_id, day in planned])
+    return planned, unscheduled
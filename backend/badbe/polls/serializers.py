@@ -17,17 +17,136 @@ Note:
     when your models change.
 """
 
+import calendar
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from monthdelta import monthdelta
-from rest_framework import serializers
-from polls.models import Employee, Department, Account, Appointment, Template
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+from polls.models import Employee, Department, Account, Appointment, Template, PdfJob
+from polls.stats import COUNTERS as DEPARTMENT_STATS_COUNTERS
 from django.contrib.auth import update_session_auth_hash
 
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Lets clients of read requests restrict the serialized fields with `?fields=a,b` or drop some with `?omit=c,d`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        requested_fields = self.get_requested_fields(request.query_params)
+        for field_name in list(self.fields):
+            if field_name not in requested_fields:
+                self.fields.pop(field_name)
+
+    @classmethod
+    def get_requested_fields(cls, query_params):
+        """
+        Returns the names of the declared fields selected by the `fields` and `omit` query parameters.
+        """
+        requested_fields = list(cls.Meta.fields)
+        if query_params.get('fields'):
+            selected = query_params['fields'].split(',')
+            requested_fields = [name for name in requested_fields if name in selected or name == 'id']
+        if query_params.get('omit'):
+            omitted = query_params['omit'].split(',')
+            requested_fields = [name for name in requested_fields if name not in omitted or name == 'id']
+        return requested_fields
+
+
+class LeanRowSerializer:
+    """
+    A read-only serializer producing the same representation as the given model serializer instance,
+    but from the rows of `QuerySet.values_list(*self.columns)` instead of model instances. The conversion of
+    each field is chosen once per serializer instead of once per row, and the per-field machinery of DRF is skipped.
+    Only serializers whose fields all map to model columns are supported, see `supports()`.
+    """
+
+    # fields whose representation of a value loaded from the database is the value itself
+    IDENTITY_FIELDS = (serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+                       serializers.BooleanField)
+
+    def __init__(self, serializer):
+        fields = [(name, field) for name, field in serializer.fields.items() if not field.write_only]
+        self.columns = [field.source for _, field in fields]
+        self.converters = [(name, index, self.compile(field)) for index, (name, field) in enumerate(fields)]
+
+    @classmethod
+    def supports(cls, serializer):
+        model_fields = {field.name for field in serializer.Meta.model._meta.concrete_fields}
+        return all(field.source in model_fields for field in serializer.fields.values() if not field.write_only)
+
+    @staticmethod
+    def compile(field):
+        """
+        Returns a function converting a non-null column value into the representation of the given field,
+        or None if the value is its own representation.
+        """
+        if type(field) in LeanRowSerializer.IDENTITY_FIELDS or \
+                (isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None):
+            return None
+        if isinstance(field, serializers.DateField):
+            output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+            if output_format == '%d.%m.%Y':
+                return lambda value: f'{value.day:02d}.{value.month:02d}.{value.year}'
+            if output_format == ISO_8601:
+                return date.isoformat
+        return field.to_representation
+
+    def to_representation(self, rows):
+        """
+        Converts the given rows into a list of representations.
+        Rows may hold further columns after `self.columns`, e.g. the ones needed for pagination.
+        """
+        data = []
+        for row in rows:
+            item = {}
+            for name, index, convert in self.converters:
+                value = row[index]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A primary key related field which looks up the related object in `context['related_objects'][field_name]`,
+    a dict mapping primary keys to objects, if present. This way a batch of objects is validated with one
+    query per related model instead of one per object (see `polls.bulk`).
+    """
+
+    def to_internal_value(self, data):
+        related_objects = self.context.get('related_objects', {}).get(self.field_name)
+        if related_objects is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return related_objects[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class EmployeeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for `polls.models.Appointment`.
     """
+    serializer_related_field = CachedPrimaryKeyRelatedField
+
     # appointment_set = serializers.HyperlinkedRelatedField(queryset=Appointment.objects.all(), many=True,
     #                                                       read_only=False, view_name='appointment-detail')
     # appointment_set = AppointmentSerializer(many=True, read_only=False)
@@ -56,11 +175,42 @@ class EmployeeSerializer(serializers.ModelSerializer):
         return employee
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class EmployeeImportSerializer(serializers.ModelSerializer):
+    """
+    Validates a row of an employee import (see `polls.importer`).
+    The department is given by its name, which is looked up in `context['departments']`, a dict mapping
+    department names to departments.
+    """
+    department = serializers.CharField()
+    date_of_birth = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"])
+    date_of_entry = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"])
+    date_of_exit = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False, allow_null=True)
+
+    class Meta:
+        model = Employee
+        fields = ['employee_id', 'first_name', 'last_name', 'gender',
+                  'date_of_birth', 'date_of_entry', 'date_of_exit',
+                  'department', 'wants_reminder', 'reminder_interval', 'notes', 'active', ]
+        # employees are upserted by their employee_id
+        extra_kwargs = {'employee_id': {'validators': []}}
+
+    def validate_department(self, value):
+        department = self.context['departments'].get(value.strip())
+        if department is None:
+            raise serializers.ValidationError(f'Unknown department "{value}".')
+        return department
+
+
+DOUBLE_BOOKING_MESSAGE = 'The employee already has an appointment on this date.'
+
+
+class AppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for `polls.models.Appointment`.
     """
 
+    serializer_related_field = CachedPrimaryKeyRelatedField
+
     # employee_set = EmployeeSerializer()
     date = serializers.DateField(
         format="%d.%m.%Y", input_formats=["%d.%m.%Y", "%Y-%m-%d"])
@@ -69,30 +219,186 @@ class AppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = ['id', 'date', 'employee', 'note', ]
         id = serializers.IntegerField(read_only=True)
+        # DRF does not derive validators from UniqueConstraint
+        validators = [UniqueTogetherValidator(queryset=Appointment.objects.all(), fields=['employee', 'date'],
+                                              message=DOUBLE_BOOKING_MESSAGE)]
 
     # automatically sets next_reminder of employee to date of last appointment plus reminder interval
     def create(self, validated_data):
-        appointment = Appointment.objects.create(**validated_data)
-        employee = appointment.employee
-        employee.next_reminder = Appointment.objects.filter(employee=employee).latest('date').date + monthdelta(
-            months=employee.reminder_interval)
-        employee.reminder_interval = employee.department.reminder_interval
-        employee.save()
+        with transaction.atomic():
+            appointment = Appointment.objects.create(**validated_data)
+            employee = appointment.employee
+            Employee.objects.filter(pk=employee.pk).record_appointment_date(appointment.date)
+            employee.refresh_from_db(fields=['last_appointment_date'])
+            employee.reminder_interval = employee.department.reminder_interval
+            employee.next_reminder = employee.derive_next_reminder()
+            employee.save(update_fields=['next_reminder', 'reminder_interval'])
         return appointment
 
     # automatically sets next_reminder of employee to date of last appointment plus reminder interval
     def update(self, instance, validated_data):
+        previous_employee_id = instance.employee_id
         instance.id = validated_data.get('id', instance.id)
         instance.date = validated_data.get('date', instance.date)
         instance.employee = validated_data.get('employee', instance.employee)
-        instance.save()
-        employee = instance.employee
-        employee.next_reminder = Appointment.objects.filter(employee=employee).latest('date').date + monthdelta(
-            months=employee.reminder_interval)
-        employee.save()
+        with transaction.atomic():
+            instance.save()
+            Employee.objects.filter(pk__in=[previous_employee_id, instance.employee_id]).refresh_appointment_dates()
         return instance
 
 
+class CoverLetterBatchSerializer(serializers.Serializer):
+    """
+    Validates the selection of employees for a batch of cover letters:
+    a list of employee ids and/or a range of `next_reminder` dates.
+    """
+
+    employees = serializers.ListField(child=serializers.IntegerField(), required=False)
+    reminder_after = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    reminder_before = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+
+    def validate(self, data):
+        if not any(data.get(key) for key in ['employees', 'reminder_after', 'reminder_before']):
+            raise serializers.ValidationError('Either employees or a reminder date range must be given.')
+        return data
+
+    def selected_employees(self):
+        """
+        Returns the queryset of the selected employees, including the fields needed by the cover letter template.
+        """
+        employees = Employee.objects.select_related('department').only(
+            'id', 'first_name', 'last_name', 'gender', 'department__name')
+        if self.validated_data.get('employees'):
+            employees = employees.filter(pk__in=self.validated_data['employees'])
+        if self.validated_data.get('reminder_after'):
+            employees = employees.filter(next_reminder__gte=self.validated_data['reminder_after'])
+        if self.validated_data.get('reminder_before'):
+            employees = employees.filter(next_reminder__lte=self.validated_data['reminder_before'])
+        return employees
+
+
+class ProposedAppointmentSerializer(serializers.Serializer):
+    """
+    Validates a proposed appointment (employee id and date) to be checked for double bookings.
+    """
+
+    employee = serializers.IntegerField()
+    date = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"])
+
+
+class AppointmentScheduleSerializer(serializers.Serializer):
+    """
+    Validates the parameters of an automatic scheduling run (see `polls.scheduler.schedule_appointments`).
+    Appointments are scheduled from tomorrow on for four weeks by default.
+    """
+
+    start = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    end = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    capacity = serializers.IntegerField(min_value=1, required=False)
+    reminder_after = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    reminder_before = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        data.setdefault('start', timezone.localdate() + timedelta(days=1))
+        data.setdefault('end', data['start'] + timedelta(weeks=4))
+        data.setdefault('capacity', settings.POLLS.get('SCHEDULER_DAILY_CAPACITY', 20))
+        if not data['start'] <= data['end'] <= data['start'] + timedelta(days=366):
+            raise serializers.ValidationError('The end must lie within a year after the start.')
+        return data
+
+
+class AppointmentCalendarSerializer(serializers.Serializer):
+    """
+    Validates the period of an appointment calendar, either a month ("YYYY-MM" or "MM.YYYY")
+    or a range of up to a year, and counts the appointments per day of the period.
+    Defaults to the current month.
+    """
+
+    MONTH_FORMATS = ['%Y-%m', '%m.%Y']
+
+    month = serializers.CharField(required=False)
+    start = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    end = serializers.DateField(input_formats=["%d.%m.%Y", "%Y-%m-%d"], required=False)
+    by_department = serializers.BooleanField(default=False)
+
+    def validate_month(self, value):
+        for month_format in self.MONTH_FORMATS:
+            try:
+                return datetime.strptime(value, month_format).date()
+            except ValueError:
+                pass
+        raise serializers.ValidationError('Expected a month in the format YYYY-MM or MM.YYYY.')
+
+    def validate(self, data):
+        if 'month' in data or ('start' not in data and 'end' not in data):
+            first = data.pop('month', timezone.localdate().replace(day=1))
+            data['start'] = first
+            data['end'] = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+        elif 'start' not in data or 'end' not in data:
+            raise serializers.ValidationError('Either a month or start and end must be given.')
+        if not data['start'] <= data['end'] < data['start'] + timedelta(days=366):
+            raise serializers.ValidationError('The end must lie within a year after the start.')
+        return data
+
+    def counts(self, appointments):
+        """
+        Groups the given appointments of the period by date (and department of the employee if `by_department` is set)
+        with a single query.
+        :return: A queryset of (date, [department,] total, confirmed) tuples ordered by date.
+        """
+        group_by = ['date', 'employee__department__id'] if self.validated_data['by_department'] else ['date']
+        return appointments.filter(date__gte=self.validated_data['start'], date__lte=self.validated_data['end']) \
+            .order_by(*group_by).values_list(*group_by) \
+            .annotate(total=Count('id'), confirmed=Count('id', filter=Q(confirmed=True)))
+
+    def summarize(self, appointments):
+        """
+        Returns the number of appointments, confirmed and unconfirmed ones, in the whole period and on each day
+        of the period, including the days without appointments. If `by_department` is set, each day also lists
+        the counts per department of the employees.
+        """
+        start, end = self.validated_data['start'], self.validated_data['end']
+        by_department = self.validated_data['by_department']
+        days = {}
+        for offset in range((end - start).days + 1):
+            day = start + timedelta(days=offset)
+            days[day] = {'date': day.strftime('%d.%m.%Y'), 'total': 0, 'confirmed': 0, 'unconfirmed': 0}
+            if by_department:
+                days[day]['departments'] = []
+
+        totals = {'total': 0, 'confirmed': 0, 'unconfirmed': 0}
+        for row in self.counts(appointments):
+            total, confirmed = row[-2:]
+            counts = {'total': total, 'confirmed': confirmed, 'unconfirmed': total - confirmed}
+            for summary in (days[row[0]], totals):
+                for key, value in counts.items():
+                    summary[key] += value
+            if by_department:
+                days[row[0]]['departments'].append({'department': row[1], **counts})
+        return {'start': start.strftime('%d.%m.%Y'), 'end': end.strftime('%d.%m.%Y'), **totals,
+                'days': list(days.values())}
+
+
+class PdfJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for `polls.models.PdfJob`.
+    """
+
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PdfJob
+        fields = ['id', 'status', 'attempts', 'error', 'created_at', 'started_at', 'finished_at', 'download', ]
+        read_only_fields = fields
+
+    def get_download(self, job):
+        if job.status != PdfJob.STATUS_DONE:
+            return None
+        return reverse('pdfjob-download', kwargs={'pk': job.pk}, request=self.context.get('request'))
+
+
 class TemplateSerializer(serializers.ModelSerializer):
     """
     Serializer for `polls.models.Template`.
@@ -106,15 +412,73 @@ class TemplateSerializer(serializers.ModelSerializer):
 class DepartmentSerializer(serializers.ModelSerializer):
     """
     Serializer for `polls.models.Department`.
+
+    The representation of `employee_set` is selected with the `employees` query parameter:
+    `links` (default) renders hyperlinks to the employees, `ids` their primary keys and `count` their number.
+    The latter expects the queryset to be annotated with `employee_count`.
+    `stats` holds the counters of `polls.models.DepartmentStats`, which should be selected with the department,
+    and whether they are stale, i.e. wait for `polls.stats.refresh_department_stats`.
     """
-    employee_set = serializers.HyperlinkedRelatedField(
-        many=True, read_only=True, view_name='employee-detail')
+    EMPLOYEE_SET_MODES = ('links', 'ids', 'count')
+
+    employee_set = serializers.SerializerMethodField()
+    stats = serializers.SerializerMethodField()
 
     class Meta:
         model = Department
-        fields = ['id', 'name', 'employee_set', ]
+        fields = ['id', 'name', 'reminder_interval', 'employee_set', 'stats', ]
         id = serializers.IntegerField(read_only=True)
 
+    # cascades a changed reminder interval to the employees following the department's interval
+    def update(self, instance, validated_data):
+        previous_interval = instance.reminder_interval
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if instance.reminder_interval != previous_interval:
+                Employee.objects.filter(department=instance).cascade_reminder_interval(previous_interval,
+                                                                                       instance.reminder_interval)
+        return instance
+
+    @classmethod
+    def get_employee_set_mode(cls, query_params):
+        mode = query_params.get('employees', cls.EMPLOYEE_SET_MODES[0])
+        if mode not in cls.EMPLOYEE_SET_MODES:
+            raise serializers.ValidationError(
+                {'employees': f'Unknown mode "{mode}", expected one of {", ".join(cls.EMPLOYEE_SET_MODES)}.'})
+        return mode
+
+    def get_employee_set(self, department):
+        if self.employee_set_mode == 'count':
+            if hasattr(department, 'employee_count'):
+                return department.employee_count
+            return department.employee_set.count()
+        employee_ids = [employee.pk for employee in department.employee_set.all()]
+        if self.employee_set_mode == 'ids':
+            return employee_ids
+        return [f'{self.employee_url_prefix}{pk}/' for pk in employee_ids]
+
+    def get_stats(self, department):
+        stats = getattr(department, 'stats', None)
+        if stats is None:
+            return None
+        representation = {counter: getattr(stats, counter) for counter in DEPARTMENT_STATS_COUNTERS}
+        representation['computed_on'] = stats.computed_on
+        representation['stale'] = stats.stale or stats.computed_on != timezone.localdate()
+        return representation
+
+    @cached_property
+    def employee_set_mode(self):
+        request = self.context.get('request')
+        if request is None:
+            return self.EMPLOYEE_SET_MODES[0]
+        return self.get_employee_set_mode(request.query_params)
+
+    @cached_property
+    def employee_url_prefix(self):
+        # reverse() once per serializer instead of once per employee
+        url = reverse('employee-detail', kwargs={'pk': 0}, request=self.context.get('request'))
+        return url[:-len('0/')]
+
 
 class AccountSerializer(serializers.ModelSerializer):
     """
@@ -0,0 +1,84 @@
+"""
+This file defines the signal handlers of this project. They are connected in `polls.apps.PollsConfig.ready`.
+
+See https://docs.djangoproject.com/en/3.0/topics/signals/
+"""
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from polls import stats
+from polls.models import Employee, Appointment, Template, Tombstone, Department, Account, TableVersion, \
+    DepartmentStats, rows_written
+
+
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=Template)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model=sender._meta.label, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=Template)
+@receiver(post_delete, sender=Template)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def bump_table_version(sender, **kwargs):
+    TableVersion.objects.bump(sender)
+
+
+# The department statistics (see polls.stats) compare the stored state of an employee or appointment, fetched
+# before it is saved, with its new state, a deleted instance is compared with nothing
+@receiver(pre_save, sender=Employee)
+@receiver(pre_save, sender=Appointment)
+def remember_stored_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stats_state = None
+    if instance.pk is not None and not raw and stats.counted(sender, update_fields):
+        instance._stats_state = stats.stored_state(instance)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def count_employee(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    deleted = kwargs['signal'] is post_delete
+    if not (deleted or created or stats.counted(sender, update_fields)):
+        return
+    new_state = None if deleted else stats.employee_state(instance)
+    old_state = stats.employee_state(instance) if deleted else None if created else instance._stats_state
+    if raw or (not created and old_state is None) or (not deleted and new_state is None):
+        stats.mark_all_stale()
+    else:
+        stats.record_employee_change(instance.pk, old_state, new_state)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def count_appointment(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    deleted = kwargs['signal'] is post_delete
+    if not (deleted or created or stats.counted(sender, update_fields)):
+        return
+    new_state = None if deleted else stats.appointment_state(instance)
+    old_state = stats.appointment_state(instance) if deleted else None if created else instance._stats_state
+    if raw or (not created and old_state is None) or (not deleted and new_state is None):
+        stats.mark_all_stale()
+    else:
+        stats.record_appointment_change(old_state, new_state)
+
+
+@receiver(post_save, sender=Department)
+def create_department_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        DepartmentStats.objects.create(department=instance, computed_on=timezone.localdate())
+
+
+@receiver(rows_written, sender=Employee)
+@receiver(rows_written, sender=Appointment)
+def mark_department_stats_stale(sender, queryset, fields=None, **kwargs):
+    stats.mark_stale(sender, queryset, fields)
@@ -0,0 +1,218 @@
+"""
+This file implements the statistics of the departments, see `polls.models.DepartmentStats`.
+
+Saving or deleting a single employee or appointment applies the change of its contribution to the counters
+of its department (see the signal handlers in `polls.signals`). Set-based writes mark the counters of the
+affected departments as stale instead. Stale counters, and all counters once the day has changed, are rebuilt
+with a few grouped queries by the `reconcile_department_stats` management command, reads never write them.
+"""
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from polls.models import Appointment, Department, DepartmentStats, Employee
+
+COUNTERS = ('active_employees', 'due_soon', 'overdue', 'appointments_this_year')
+
+# The fields of employees and appointments the counters depend on
+EMPLOYEE_STATE_FIELDS = ('department_id', 'active', 'wants_reminder', 'next_reminder')
+APPOINTMENT_STATE_FIELDS = ('employee_id', 'date')
+
+
+def _state(instance, fields, date_field):
+    # reads the instance dict, so that deferred fields are not loaded
+    try:
+        state = tuple(instance.__dict__[field] for field in fields)
+    except KeyError:
+        return None
+    # e.g. dates assigned as strings are only converted by the database
+    value = instance.__dict__[date_field]
+    if value is not None and not isinstance(value, date):
+        return None
+    return state
+
+
+def employee_state(employee):
+    """
+    Returns the values of the `EMPLOYEE_STATE_FIELDS` of the given employee,
+    or None if they are not known, e.g. because some of them are deferred.
+    """
+    return _state(employee, EMPLOYEE_STATE_FIELDS, 'next_reminder')
+
+
+def appointment_state(appointment):
+    """
+    Returns the values of the `APPOINTMENT_STATE_FIELDS` of the given appointment or None if they are not known.
+    """
+    return _state(appointment, APPOINTMENT_STATE_FIELDS, 'date')
+
+
+def stored_state(instance):
+    """
+    Fetches the state (see `employee_state`) of the given employee or appointment as it is stored in the database
+    with a single narrow query.
+    :return: The state or None if the instance is not stored.
+    """
+    fields = EMPLOYEE_STATE_FIELDS if isinstance(instance, Employee) else APPOINTMENT_STATE_FIELDS
+    return type(instance)._base_manager.filter(pk=instance.pk).values_list(*fields).first()
+
+
+def counted(model, update_fields=None):
+    """
+    Returns whether saving an employee or appointment with the given `update_fields` may change the counters.
+    """
+    if update_fields is None:
+        return True
+    fields = [model._meta.get_field(field) for field in
+              (EMPLOYEE_STATE_FIELDS if model is Employee else APPOINTMENT_STATE_FIELDS)]
+    return any(field.name in update_fields or field.attname in update_fields for field in fields)
+
+
+def employee_counters(state, today):
+    """
+    Returns the contribution of an employee in the given state to the counters of its department.
+    """
+    _, active, wants_reminder, next_reminder = state
+    reminded = active and wants_reminder and next_reminder is not None
+    ahead = timedelta(days=settings.POLLS['NOTIFY_APPOINTMENT_AHEAD'])
+    return {
+        'active_employees': int(bool(active)),
+        'due_soon': int(bool(reminded and today <= next_reminder <= today + ahead)),
+        'overdue': int(bool(reminded and next_reminder < today)),
+    }
+
+
+def _year(today):
+    return date(today.year, 1, 1), date(today.year, 12, 31)
+
+
+def _add(department_id, changes, today):
+    changes = {counter: F(counter) + delta for counter, delta in changes.items() if delta}
+    if changes and department_id is not None:
+        # counters of another day are stale anyway
+        DepartmentStats.objects.filter(department_id=department_id, computed_on=today).update(**changes)
+
+
+def record_employee_change(employee_id, old_state, new_state):
+    """
+    Applies the change of an employee from the old to the new state (see `employee_state`) to the counters.
+    :param old_state: None for a created employee.
+    :param new_state: None for a deleted employee.
+    """
+    today = timezone.localdate()
+    old = employee_counters(old_state, today) if old_state else {}
+    new = employee_counters(new_state, today) if new_state else {}
+    old_department = old_state[0] if old_state else None
+    new_department = new_state[0] if new_state else None
+    if old_department == new_department:
+        _add(new_department, {counter: new.get(counter, 0) - old.get(counter, 0) for counter in COUNTERS}, today)
+        return
+    _add(old_department, {counter: -value for counter, value in old.items()}, today)
+    _add(new_department, new, today)
+    if old_state and new_state:
+        # the appointments of an employee count for its current department
+        moved = Appointment.objects.filter(employee_id=employee_id, date__range=_year(today)).count()
+        _add(old_department, {'appointments_this_year': -moved}, today)
+        _add(new_department, {'appointments_this_year': moved}, today)
+
+
+def record_appointment_change(old_state, new_state):
+    """
+    Applies the change of an appointment from the old to the new state (see `appointment_state`) to the counters.
+    :param old_state: None for a created appointment.
+    :param new_state: None for a deleted appointment.
+    """
+    today = timezone.localdate()
+    old_employee = old_state[0] if old_state and old_state[1].year == today.year else None
+    new_employee = new_state[0] if new_state and new_state[1].year == today.year else None
+    if old_employee == new_employee:
+        return
+    departments = dict(Employee.objects.filter(pk__in={old_employee, new_employee} - {None})
+                       .values_list('pk', 'department'))
+    if departments.get(old_employee) == departments.get(new_employee):
+        return
+    _add(departments.get(old_employee), {'appointments_this_year': -1}, today)
+    _add(departments.get(new_employee), {'appointments_this_year': 1}, today)
+
+
+def mark_stale(model, queryset, fields=None):
+    """
+    Marks the counters of the departments affected by a set-based write as stale, see `polls.models.rows_written`.
+    :param queryset: The written employees or appointments, evaluated before an update.
+    :param fields: The set of updated fields or None for inserted rows.
+    """
+    if model is Employee:
+        relation, moving, counted = 'department', {'department', 'department_id'}, set(EMPLOYEE_STATE_FIELDS)
+    else:
+        relation, moving, counted = 'employee__department', {'employee', 'employee_id'}, set(APPOINTMENT_STATE_FIELDS)
+    if fields is not None and not (moving | counted) & fields:
+        return
+    if fields is not None and moving & fields:
+        # the rows move to departments which are not known here
+        stats = DepartmentStats.objects.all()
+    else:
+        stats = DepartmentStats.objects.filter(department__in=queryset.order_by().values(relation))
+    stats.update(stale=True)
+
+
+def mark_all_stale():
+    """
+    Marks the counters of all departments as stale.
+    """
+    DepartmentStats.objects.update(stale=True)
+
+
+def reconcile_department_stats(departments=None, today=None):
+    """
+    Rebuilds the counters of the given departments (ids), or of all departments, with two grouped queries.
+    The rows are updated in place while they are locked, so that concurrent rebuilds and incremental changes
+    do not interleave, missing rows are inserted first.
+    :return: The list of the rebuilt `polls.models.DepartmentStats`.
+    """
+    today = today or timezone.localdate()
+    if departments is None:
+        departments = Department.objects.values_list('pk', flat=True)
+    departments = list(departments)
+    with transaction.atomic():
+        DepartmentStats.objects.bulk_create([DepartmentStats(department_id=pk, computed_on=today)
+                                             for pk in departments], ignore_conflicts=True)
+        stats = list(DepartmentStats.objects.select_for_update().filter(department__in=departments))
+        counters = _count(departments, today)
+        for row in stats:
+            for counter in COUNTERS:
+                setattr(row, counter, counters.get(row.department_id, {}).get(counter, 0))
+            row.computed_on, row.stale = today, False
+        DepartmentStats.objects.bulk_update(stats, COUNTERS + ('computed_on', 'stale'))
+    return stats
+
+
+def _count(departments, today):
+    ahead = timedelta(days=settings.POLLS['NOTIFY_APPOINTMENT_AHEAD'])
+    reminded = Q(active=True, wants_reminder=True)
+    employees = {row.pop('department'): row for row in Employee.objects.filter(department__in=departments)
+                 .order_by().values('department').annotate(
+                     active_employees=Count('id', filter=Q(active=True)),
+                     due_soon=Count('id', filter=reminded & Q(next_reminder__gte=today,
+                                                              next_reminder__lte=today + ahead)),
+                     overdue=Count('id', filter=reminded & Q(next_reminder__lt=today)))}
+    appointments = dict(Appointment.objects.filter(employee__department__in=departments, date__range=_year(today))
+                        .order_by().values_list('employee__department').annotate(count=Count('id')))
+    for pk, count in appointments.items():
+        employees.setdefault(pk, {})['appointments_this_year'] = count
+    return employees
+
+
+def refresh_department_stats(today=None):
+    """
+    Rebuilds the counters which are missing, stale or refer to another day, see `reconcile_department_stats`.
+    Costs a single query if all counters are up to date.
+    :return: The list of the rebuilt `polls.models.DepartmentStats`.
+    """
+    today = today or timezone.localdate()
+    outdated = list(Department.objects.filter(Q(stats__isnull=True) | Q(stats__stale=True)
+                                              | ~Q(stats__computed_on=today)).values_list('pk', flat=True))
+    return reconcile_department_stats(outdated, today) if outdated else []
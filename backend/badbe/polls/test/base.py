@@ -0,0 +1,41 @@
+"""
+Base classes of the test cases, kept apart from `polls.test.testing_utils`, which is also used without Django
+by `mocker.py`.
+"""
+
+import shutil
+import tempfile
+
+from rest_framework.test import APITestCase
+
+from polls.letter_cache import letter_cache
+from polls.models import Account
+
+
+class AuthenticatedApiTestCase(APITestCase):
+    """
+    Base test case for the API endpoints, whose requests are sent in-process by `self.client` on behalf of
+    `self.user`.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = Account.objects.create(username="Mary", email="maria@m.de", first_name="Maria",
+                                           last_name="Mario")
+        self.client.force_authenticate(self.user)
+
+
+class TemporaryLetterCacheMixin:
+    """
+    Points the letter cache to a temporary directory for the duration of each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.letter_cache_directory = letter_cache.directory
+        letter_cache.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(letter_cache.directory)
+        letter_cache.directory = self.letter_cache_directory
+        super().tearDown()
@@ -1,4 +1,3 @@
-import subprocess
 import uuid
 import json
 import requests
@@ -116,17 +115,17 @@ def next_mock_user() -> Dict[str, str]:
 
 def create_employees(employee_list: List[Dict[str, str]], verbose=False):
     """
-    Sends HTTP requests to create mock employees.
+    Sends a single HTTP request to create mock employees in one batch.
     :param employee_list: List of employee entries to create. An en employee entry is a dict object.
     :param verbose: If true, enables HTTP response logging for sent requests.
+    :raises requests.HTTPError: If the batch is rejected, in which case none of the employees are created.
     """
-    for employee in employee_list:
-        cmd = ["http", "POST", "http://127.0.0.1:8000/employees/"] + dict_to_list(employee) + ["--ignore-stdin", ]
-        if verbose:
-            cmd += ["--verbose", ]
-        print(f'Run command: {" ".join(cmd)}\n')
-        subprocess.run(cmd)
+    r = requests.post('http://127.0.0.1:8000/employees/bulk/', json=employee_list)
+    if verbose or not r.ok:
+        # the errors of the rejected rows
+        print(r.content)
         print()
+    r.raise_for_status()
 
 
 def dict_to_list(data_dict: Dict[str, str]) -> List[str]:
@@ -0,0 +1,928 @@
+"""
+API test cases of the endpoints, whose requests are sent in-process with DRF's `APIClient`,
+so that unlike `polls.test.tests_api_backend` they do not need a running server.
+
+Running these tests: python manage.py test polls.test.tests_api_backend_apifactory
+"""
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from polls.test.resource import MOCK_DEPARTMENTS
+from datetime import date, timedelta
+from PyPDF2 import PdfFileReader
+import csv
+import io
+import json
+import os
+import tempfile
+
+from polls.importer import EmployeeImporter, read_rows
+from polls.jobs import run_worker
+from polls.models import Employee, Department, Appointment, Template, PdfJob, DepartmentStats, Tombstone
+from polls.serializers import EmployeeSerializer, AppointmentSerializer, LeanRowSerializer
+from polls.reminders import DUE_REMINDER_FIELDS
+from polls import renderers
+from polls.stats import COUNTERS as DEPARTMENT_STATS_COUNTERS, refresh_department_stats
+from polls.test.base import AuthenticatedApiTestCase, TemporaryLetterCacheMixin
+from polls.utils import fill_template, template_cache
+
+
+class KeysetPaginationTest(AuthenticatedApiTestCase):
+    """
+    API test case for the `polls.pagination.KeysetPagination` used by the list endpoints.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        for i in range(5):
+            # equal last names exercise the id tie-break
+            Employee.objects.create(employee_id=str(i), first_name=str(i), last_name='Lo' if i % 2 else 'Abe',
+                                    date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                    department=department)
+
+    def test_cursor_pages(self):
+        ids = []
+        url = '/employees/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [employee['id'] for employee in page['results']]
+            url = page['next']
+        expected = list(Employee.objects.order_by('last_name', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_previous_pages(self):
+        url, page = '/employees/?page_size=2', None
+        while url:
+            page = self.client.get(url).json()
+            url = page['next']
+        ids = [employee['id'] for employee in page['results']]
+        url = page['previous']
+        while url:
+            page = self.client.get(url).json()
+            ids = [employee['id'] for employee in page['results']] + ids
+            url = page['previous']
+        expected = list(Employee.objects.order_by('last_name', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/employees/?cursor=cD1mb28%3D')
+        self.assertEqual(response.status_code, 404)
+
+    def test_offset_pages(self):
+        page = self.client.get('/employees/?pagination=offset&limit=2&offset=3').json()
+        self.assertEqual(page['count'], 5)
+        expected = list(Employee.objects.order_by('last_name', 'id').values_list('id', flat=True))[3:5]
+        self.assertEqual([employee['id'] for employee in page['results']], expected)
+
+
+class SparseFieldsetTest(AuthenticatedApiTestCase):
+    """
+    API test case for the `fields` and `omit` query parameters of the employee endpoints.
+    """
+
+    def setUp(self):
+        super().setUp()
+        Employee.objects.create(employee_id='1', first_name='John', last_name='Doe', notes='secret',
+                                date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                department=Department.objects.create(name="Mensa"))
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get('/employees/?fields=first_name,last_name,department,next_reminder').json()
+        self.assertEqual(set(page['results'][0]), {'id', 'first_name', 'last_name', 'department', 'next_reminder'})
+        self.assertFalse(any('"notes"' in query['sql'] for query in queries.captured_queries))
+
+    def test_omit(self):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get('/employees/?omit=notes').json()
+        self.assertNotIn('notes', page['results'][0])
+        self.assertIn('date_of_birth', page['results'][0])
+        self.assertFalse(any('"notes"' in query['sql'] for query in queries.captured_queries))
+
+
+class DepartmentApiTest(AuthenticatedApiTestCase):
+    """
+    API test case for the employee representations of the department endpoints.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for name in MOCK_DEPARTMENTS:
+            department = Department.objects.create(name=name)
+            for i in range(3):
+                Employee.objects.create(employee_id=f'{name}{i}', first_name='J', last_name='Lo',
+                                        date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                        department=department)
+
+    # Each request reads the table versions for the ETag (see ConditionalGetMixin) in addition to the listed queries
+
+    def test_links(self):
+        with self.assertNumQueries(3):
+            departments = self.client.get('/departments/').json()
+        self.assertEqual(len(departments), len(MOCK_DEPARTMENTS))
+        employee = Employee.objects.filter(department__name=departments[0]['name']).order_by('last_name', 'id')[0]
+        self.assertEqual(departments[0]['employee_set'][0], f'http://testserver/employees/{employee.pk}/')
+
+    def test_ids(self):
+        with self.assertNumQueries(3):
+            departments = self.client.get('/departments/?employees=ids').json()
+        for department in departments:
+            expected = Employee.objects.filter(department=department['id']).values_list('id', flat=True)
+            self.assertEqual(set(department['employee_set']), set(expected))
+
+    def test_count(self):
+        with self.assertNumQueries(2):
+            departments = self.client.get('/departments/?employees=count').json()
+        self.assertEqual({department['employee_set'] for department in departments}, {3})
+
+    def test_unknown_mode(self):
+        self.assertEqual(self.client.get('/departments/?employees=all').status_code, 400)
+
+
+class TemplateCacheApiTest(AuthenticatedApiTestCase):
+    """
+    API test case for the compiled template cache used by `polls.utils.fill_template`.
+    """
+
+    def setUp(self):
+        super().setUp()
+        template_cache.clear()
+        self.template = Template.objects.create(name="new", template_body="Hallo {{ first_name }}")
+
+    def test_hit_and_miss(self):
+        self.assertEqual(fill_template(self.template.template_body, {'first_name': 'Jay'}, self.template.pk),
+                         "Hallo Jay")
+        self.assertEqual(fill_template(self.template.template_body, {'first_name': 'Kay'}, self.template.pk),
+                         "Hallo Kay")
+        stats = self.client.get('/templates/cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+    def test_update_invalidates(self):
+        fill_template(self.template.template_body, {}, self.template.pk)
+        self.client.patch(f'/templates/{self.template.pk}/', {'template_body': "Tschüss"}, format='json')
+        self.assertEqual(template_cache.stats()['size'], 0)
+
+
+class CoverLetterBatchTest(TemporaryLetterCacheMixin, AuthenticatedApiTestCase):
+    """
+    API test case for the batch cover letter generation.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        for i, next_reminder in enumerate([date(2020, 1, 10), date(2020, 1, 20), date(2020, 3, 1)]):
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                    date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                    next_reminder=next_reminder, department=department)
+
+    def test_reminder_range(self):
+        r = self.client.post('/gen-pdf/batch/', {'reminder_after': '2020-01-01', 'reminder_before': '2020-01-31'},
+                             format='json')
+        self.assertEqual(r.status_code, 200)
+        pdf = PdfFileReader(io.BytesIO(b''.join(r.streaming_content)))
+        self.assertEqual(pdf.getNumPages(), 2)
+
+    def test_empty_selection(self):
+        self.assertEqual(self.client.post('/gen-pdf/batch/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/gen-pdf/batch/', {'employees': [0]}, format='json').status_code, 400)
+
+
+class PdfJobApiTest(TemporaryLetterCacheMixin, AuthenticatedApiTestCase):
+    """
+    API test case for the background PDF job queue.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        self.employees = [Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                                  date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                                  department=department) for i in range(2)]
+
+    def test_submit_poll_download(self):
+        r = self.client.post('/jobs/', {'employees': [e.pk for e in self.employees]}, format='json')
+        self.assertEqual(r.status_code, 202)
+        job = r.json()
+        self.assertEqual(job['status'], PdfJob.STATUS_PENDING)
+        self.assertEqual(self.client.get(f'/jobs/{job["id"]}/download/').status_code, 409)
+
+        self.assertEqual(run_worker(processes=1, poll_interval=0.1, once=True), 1)
+
+        job = self.client.get(f'/jobs/{job["id"]}/').json()
+        self.assertEqual(job['status'], PdfJob.STATUS_DONE)
+        r = self.client.get(job['download'])
+        self.assertEqual(PdfFileReader(io.BytesIO(r.content)).getNumPages(), 2)
+
+
+class DueRemindersTest(AuthenticatedApiTestCase):
+    """
+    API test case for the due reminders endpoint.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        department = Department.objects.create(name="Mensa")
+        today = timezone.localdate()
+        for i, (days, active, wants_reminder) in enumerate([(10, True, True), (-10, True, True), (60, True, True),
+                                                            (0, False, True), (0, True, False)]):
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                    date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                    next_reminder=today + timedelta(days=days), active=active,
+                                    wants_reminder=wants_reminder, department=department)
+
+    def test_due(self):
+        due = self.client.get('/employees/due/').json()
+        self.assertEqual([employee['last_name'] for employee in due], ['Lo1', 'Lo0'])
+        self.assertEqual(set(due[0]), set(DUE_REMINDER_FIELDS))
+
+    def test_cached_until_write(self):
+        self.client.get('/employees/due/')
+        # only the version of the employee table is read
+        with self.assertNumQueries(1):
+            self.client.get('/employees/due/')
+        employee = Employee.objects.get(last_name='Lo0')
+        self.client.patch(f'/employees/{employee.pk}/', {'wants_reminder': False}, format='json')
+        self.assertEqual([employee['last_name'] for employee in self.client.get('/employees/due/').json()], ['Lo1'])
+
+
+class DeltaSyncTest(AuthenticatedApiTestCase):
+    """
+    API test case for the `updated_since` delta synchronization of the list endpoints.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        self.employees = [Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                                  date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                                  department=department) for i in range(3)]
+        Employee.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.since = (timezone.now() - timedelta(minutes=10)).isoformat()
+
+    def test_employee_delta(self):
+        self.client.patch(f'/employees/{self.employees[0].pk}/', {'notes': 'changed'}, format='json')
+        self.client.delete(f'/employees/{self.employees[1].pk}/')
+
+        delta = self.client.get('/employees/', {'updated_since': self.since}).json()
+        self.assertEqual([employee['id'] for employee in delta['results']], [self.employees[0].pk])
+        self.assertEqual(delta['deleted'], [self.employees[1].pk])
+        self.assertFalse(delta['full_resync'])
+
+    def test_watermark_margin(self):
+        started = timezone.now()
+        watermark = parse_datetime(self.client.get('/employees/', {'updated_since': self.since}).json()['watermark'])
+        self.assertLessEqual(watermark, started - timedelta(seconds=settings.POLLS['DELTA_SYNC_MARGIN_SECONDS'] - 1))
+
+    def test_full_resync(self):
+        self.employees[1].delete()
+        delta = self.client.get('/employees/', {'updated_since': '2000-01-01T00:00:00Z'}).json()
+        self.assertTrue(delta['full_resync'])
+        self.assertEqual({employee['id'] for employee in delta['results']},
+                         {self.employees[0].pk, self.employees[2].pk})
+        self.assertEqual(delta['deleted'], [])
+
+    def test_prune_tombstones(self):
+        old, recent = self.employees[1].pk, self.employees[2].pk
+        self.employees[1].delete()
+        self.employees[2].delete()
+        Tombstone.objects.filter(object_id=old).update(deleted_at=Tombstone.objects.retained_since()
+                                                       - timedelta(minutes=1))
+        out = io.StringIO()
+        call_command('prune_tombstones', stdout=out)
+        self.assertIn('Deleted 1 records', out.getvalue())
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [recent])
+
+    def test_queryset_update_stamps_updated_at(self):
+        before = Employee.objects.get(pk=self.employees[2].pk).updated_at
+        Employee.objects.filter(pk=self.employees[2].pk).update(notes='changed')
+        self.assertGreater(Employee.objects.get(pk=self.employees[2].pk).updated_at, before)
+
+    def test_template_delta(self):
+        template = Template.objects.create(name="new")
+        delta = self.client.get('/templates/', {'updated_since': self.since}).json()
+        self.assertEqual([t['id'] for t in delta['results']], [template.pk])
+        self.assertEqual(delta['deleted'], [])
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get('/employees/', {'updated_since': 'yesterday'}).status_code, 400)
+
+
+class ConditionalGetTest(AuthenticatedApiTestCase):
+    """
+    API test case for the ETag and Last-Modified handling of the list and detail endpoints.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name="Mensa")
+        self.employee = Employee.objects.create(employee_id='1', first_name='J', last_name='Lo',
+                                                date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                                department=self.department)
+
+    def test_not_modified(self):
+        r = self.client.get('/employees/')
+        self.assertEqual(r.status_code, 200)
+        # only the version counters are read
+        with self.assertNumQueries(1):
+            r = self.client.get('/employees/', HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(r.status_code, 304)
+
+    def test_modified(self):
+        etag = self.client.get(f'/employees/{self.employee.pk}/')['ETag']
+        self.client.patch(f'/employees/{self.employee.pk}/', {'notes': 'changed'}, format='json')
+        r = self.client.get(f'/employees/{self.employee.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r['ETag'], etag)
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(self.client.get('/employees/')['ETag'], self.client.get('/employees/?active=true')['ETag'])
+
+    def test_department_depends_on_employees(self):
+        etag = self.client.get('/departments/')['ETag']
+        Employee.objects.filter(pk=self.employee.pk).update(department=Department.objects.create(name="IT"))
+        self.assertEqual(self.client.get('/departments/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/employees/')['Last-Modified']
+        self.assertEqual(self.client.get('/employees/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+
+class BulkTest(AuthenticatedApiTestCase):
+    """
+    API test case for the bulk endpoints of employees and appointments.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name="Mensa", reminder_interval=12)
+
+    def employee_data(self, employee_id, **kwargs):
+        return dict({'employee_id': employee_id, 'first_name': 'Jay', 'last_name': f'Z{employee_id}',
+                     'gender': 'divers', 'date_of_birth': '01.01.1990', 'date_of_entry': '01.01.2019',
+                     'department': self.department.pk}, **kwargs)
+
+    def test_create_employees(self):
+        batch = [self.employee_data(str(i)) for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/employees/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 15)
+        results = response.json()['results']
+        self.assertEqual([employee['employee_id'] for employee in results], [str(i) for i in range(50)])
+        for employee in results:
+            self.assertEqual(Employee.objects.get(pk=employee['id']).employee_id, employee['employee_id'])
+            self.assertEqual(employee['next_reminder'], '01.01.2019')
+
+    def test_atomic_batch_is_rejected(self):
+        Employee.objects.create(employee_id='taken', first_name='J', last_name='Lo', date_of_birth=date(1990, 1, 1),
+                                date_of_entry=date(2019, 1, 1), department=self.department)
+        batch = [self.employee_data('1'), self.employee_data('taken'), self.employee_data('2', department=999),
+                 self.employee_data('3'), self.employee_data('3')]
+        response = self.client.post('/employees/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2, 3, 4])
+        self.assertEqual(Employee.objects.count(), 1)
+
+    def test_non_atomic_batch_writes_valid_objects(self):
+        batch = [self.employee_data('1'), self.employee_data('2', date_of_birth='soon')]
+        response = self.client.post('/employees/bulk/?atomic=false', batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([employee['employee_id'] for employee in response.json()['results']], ['1'])
+        self.assertEqual(response.json()['errors'][0]['index'], 1)
+        self.assertIn('date_of_birth', response.json()['errors'][0]['errors'])
+
+    def test_update_employees(self):
+        created = self.client.post('/employees/bulk/', [self.employee_data('1'), self.employee_data('2')],
+                                   format='json').json()['results']
+        batch = [{'id': created[0]['id'], 'notes': 'allergic'}, {'id': created[1]['id'], 'employee_id': '1'},
+                 {'id': 0, 'notes': 'missing'}]
+        response = self.client.patch('/employees/bulk/?atomic=false', batch, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        self.assertEqual(Employee.objects.get(pk=created[0]['id']).notes, 'allergic')
+        self.assertEqual(Employee.objects.get(pk=created[1]['id']).employee_id, '2')
+
+    def test_create_and_update_appointments(self):
+        employees = self.client.post('/employees/bulk/', [self.employee_data('1'), self.employee_data('2')],
+                                     format='json').json()['results']
+        batch = [{'date': '01.03.2020', 'employee': employees[0]['id']},
+                 {'date': '01.02.2020', 'employee': employees[0]['id']},
+                 {'date': '01.05.2020', 'employee': employees[1]['id']}]
+        response = self.client.post('/appointments/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        first, second = Employee.objects.get(pk=employees[0]['id']), Employee.objects.get(pk=employees[1]['id'])
+        # the interval of the department is taken over before computing the next reminder
+        self.assertEqual((first.last_appointment_date, first.next_reminder), (date(2020, 3, 1), date(2021, 3, 1)))
+        self.assertEqual(first.reminder_interval, 12)
+        self.assertEqual(second.next_reminder, date(2021, 5, 1))
+
+        # moving the latest appointment of the first employee to the second one
+        latest = response.json()['results'][0]['id']
+        response = self.client.patch('/appointments/bulk/', [{'id': latest, 'employee': second.pk}], format='json')
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.next_reminder, date(2021, 2, 1))
+        self.assertEqual(second.next_reminder, date(2021, 5, 1))
+
+    def test_update_appointments_without_loading_employees(self):
+        employee = Employee.objects.create(employee_id='1', first_name='J', last_name='Lo',
+                                           date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                           department=self.department)
+        appointments = self.client.post('/appointments/bulk/', [
+            {'date': f'{day:02}.01.2020', 'employee': employee.pk} for day in range(1, 21)], format='json').json()
+        for appointment in appointments['results']:
+            self.assertEqual(Appointment.objects.get(pk=appointment['id']).date.strftime('%d.%m.%Y'),
+                             appointment['date'])
+
+        def update(results):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch('/appointments/bulk/', [
+                    {'id': appointment['id'], 'date': appointment['date'].replace('.01.', '.02.')}
+                    for appointment in results], format='json')
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+        self.assertEqual(update(appointments['results'][:2]), update(appointments['results']))
+
+    def test_rejects_non_list(self):
+        response = self.client.post('/employees/bulk/', self.employee_data('1'), format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class EmployeeImportTest(AuthenticatedApiTestCase):
+    """
+    API test case for importing employees from CSV and NDJSON files.
+    """
+
+    CSV = 'employee_id,first_name,last_name,gender,date_of_birth,date_of_entry,date_of_exit,department\n' \
+          '1,Jay,Z,divers,01.01.1990,01.01.2019,,Mensa\n' \
+          '2,Bea,Y,weiblich,1991-02-02,2019-02-01,,IT\n' \
+          '3,Carl,X,männlich,01.01.1990,01.01.2019,,Kantine\n'
+
+    def setUp(self):
+        super().setUp()
+        Department.objects.create(name="Mensa")
+        Department.objects.create(name="IT")
+
+    def upload(self, content, name='employees.csv', query=''):
+        return self.client.post(f'/employees/import/{query}', {'file': SimpleUploadedFile(name, content.encode())},
+                                format='multipart')
+
+    def test_import_csv(self):
+        response = self.upload(self.CSV)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary'], {'create': 2, 'error': 1})
+        self.assertEqual(response.json()['errors'], [{'row': 3, 'action': 'error', 'employee_id': '3', 'errors': {
+            'department': ['Unknown department "Kantine".']}}])
+        employee = Employee.objects.get(employee_id='2')
+        self.assertEqual((employee.department.name, employee.next_reminder), ('IT', date(2019, 2, 1)))
+
+    def test_upsert_skips_unchanged_rows(self):
+        self.upload(self.CSV)
+        ndjson = '{"employee_id": "1", "last_name": "Z", "department": "Mensa"}\n' \
+                 '{"employee_id": "2", "last_name": "Why", "department": "Mensa"}\n' \
+                 'not json\n'
+        response = self.upload(ndjson, name='employees.ndjson', query='?dry_run=true')
+        self.assertEqual(response.json()['summary'], {'unchanged': 1, 'update': 1, 'error': 1})
+        self.assertEqual([error['row'] for error in response.json()['errors']], [3])
+        records = list(EmployeeImporter(dry_run=True).run(read_rows(io.StringIO(ndjson), 'ndjson')))
+        self.assertEqual(records[1]['changes'], {'last_name': ['Y', 'Why'], 'department': ['IT', 'Mensa']})
+        self.assertEqual(Employee.objects.get(employee_id='2').last_name, 'Y')
+
+        # departments, existing employees, savepoint, stale department statistics, update, table version, release
+        with self.assertNumQueries(7):
+            self.upload(ndjson, name='employees.ndjson')
+        employee = Employee.objects.get(employee_id='2')
+        self.assertEqual((employee.last_name, employee.first_name, employee.department.name), ('Why', 'Bea', 'Mensa'))
+
+    def test_error_sample(self):
+        with self.settings(POLLS=dict(settings.POLLS, IMPORT_ERROR_SAMPLE_SIZE=2)):
+            response = self.upload('not json\n' * 5, name='employees.ndjson')
+        self.assertEqual(response.json()['summary'], {'error': 5})
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1, 2])
+
+    def test_dry_run_across_chunks(self):
+        rows = [{'employee_id': '1', 'first_name': 'Jay', 'last_name': 'Z', 'gender': 'divers',
+                 'date_of_birth': '01.01.1990', 'date_of_entry': '01.01.2019', 'department': 'Mensa'},
+                {'employee_id': '1', 'last_name': 'Zed'},
+                {'employee_id': '1', 'last_name': 'Zed'}]
+        records = list(EmployeeImporter(dry_run=True, chunk_size=1).run(rows))
+        self.assertEqual([record['action'] for record in records], ['create', 'update', 'unchanged'])
+        self.assertEqual(records[1]['changes'], {'last_name': ['Z', 'Zed']})
+        self.assertFalse(Employee.objects.exists())
+
+    def test_import_command_in_chunks(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as input_file:
+            input_file.write(self.CSV)
+        self.addCleanup(os.remove, input_file.name)
+        out = io.StringIO()
+        call_command('import_employees', input_file.name, '--chunk-size', '1', stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 3 rows (2 create, 1 error)', out.getvalue())
+        self.assertEqual(Employee.objects.count(), 2)
+
+
+class ExportTest(AuthenticatedApiTestCase):
+    """
+    API test case for the streaming exports of employees and appointments.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        for i in range(3):
+            employee = Employee.objects.create(employee_id=str(i), first_name='Jay', last_name=f'Z{i}',
+                                               notes='a, "quoted"\nnote', date_of_birth=date(1990, 1, 1),
+                                               date_of_entry=date(2019, 1, 1), department=department)
+            Appointment.objects.create(employee=employee, date=date(2020, 1, i + 1))
+
+    def test_export_employees_csv(self):
+        response = self.client.get('/employees/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="employees.csv"')
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['last_name'] for row in rows], ['Z0', 'Z1', 'Z2'])
+        self.assertEqual((rows[0]['department'], rows[0]['date_of_birth']), ('Mensa', '01.01.1990'))
+        self.assertEqual(rows[0]['notes'], 'a, "quoted"\nnote')
+
+    def test_export_appointments_ndjson(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/appointments/export/?output_format=ndjson&min_date=2020-01-02')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        appointments = [json.loads(line) for line in lines]
+        self.assertEqual([appointment['date'] for appointment in appointments], ['02.01.2020', '03.01.2020'])
+        self.assertEqual((appointments[0]['employee_id'], appointments[0]['department']), ('1', 'Mensa'))
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/employees/export/?output_format=xml').status_code, 400)
+
+
+class FastJSONRendererApiTest(AuthenticatedApiTestCase):
+    """
+    API test case for the JSON renderer and parser of `polls.renderers`.
+    """
+
+    def test_api(self):
+        response = self.client.post('/departments/', b'{"name": "Mensa"', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/departments/', b'{"name": "Mensa"}', content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.content, renderers.dumps(response.data))
+
+
+class LeanRowSerializerContractTest(AuthenticatedApiTestCase):
+    """
+    Contract test guaranteeing that the lean list serialization produces the same output as the serializers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        for i, (gender, date_of_exit, next_reminder) in enumerate([('divers', None, None),
+                                                                   ('weiblich', date(2021, 12, 31), date(2020, 2, 29)),
+                                                                   ('männlich', date(1999, 1, 9), date(2030, 10, 1))]):
+            employee = Employee.objects.create(employee_id=f'E{i}', first_name='Jöran', last_name=f'Z{i % 2}',
+                                               gender=gender, notes='' if i else 'ä "b"', wants_reminder=bool(i),
+                                               date_of_birth=date(1960 + i, i + 1, 1), date_of_entry=date(2019, 1, 1),
+                                               date_of_exit=date_of_exit, next_reminder=next_reminder,
+                                               active=i != 2, department=department)
+            Appointment.objects.create(employee=employee, date=date(2020, 1, i + 1), note=str(i))
+
+    def test_serializers(self):
+        for serializer_class in [EmployeeSerializer, AppointmentSerializer]:
+            queryset = serializer_class.Meta.model.objects.all()
+            lean_serializer = LeanRowSerializer(serializer_class())
+            self.assertEqual(lean_serializer.to_representation(queryset.values_list(*lean_serializer.columns)),
+                             json.loads(JSONRenderer().render(serializer_class(queryset, many=True).data)))
+
+    def test_list_endpoints(self):
+        for url in ['/employees/', '/employees/?fields=last_name,next_reminder', '/employees/?omit=last_name',
+                    '/employees/?pagination=offset&limit=2&offset=1', '/employees/?page_size=2&active=true',
+                    '/appointments/?page_size=1', '/appointments/?min_date=2020-01-02']:
+            with self.settings(POLLS={'LEAN_LIST_SERIALIZATION': False}):
+                expected = self.client.get(url).content
+            self.assertEqual(self.client.get(url).content, expected, url)
+
+    def test_cursor_pages(self):
+        first = self.client.get('/employees/?page_size=2').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([employee['employee_id'] for employee in first['results'] + second['results']],
+                         ['E0', 'E2', 'E1'])
+
+
+class ReminderIntervalCascadeTest(AuthenticatedApiTestCase):
+    """
+    API test case for cascading the reminder interval of a department to its employees.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name="Mensa", reminder_interval=24)
+        other = Department.objects.create(name="IT", reminder_interval=24)
+        for i, (department, last_appointment_date, reminder_interval) in enumerate([
+                (self.department, date(2020, 1, 31), 24), (self.department, None, 24),
+                (self.department, date(2020, 1, 1), 6), (other, date(2020, 1, 1), 24)]):
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                    date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                    last_appointment_date=last_appointment_date, reminder_interval=reminder_interval,
+                                    department=department)
+        Employee.objects.all().recompute_next_reminder()
+
+    def test_preview(self):
+        response = self.client.get(f'/departments/{self.department.pk}/reminder-interval-preview/?reminder_interval=13')
+        self.assertEqual(response.json(), {'employees': 2, 'earlier': 1, 'later': 0, 'unset': 0,
+                                           'reminder_interval': 13, 'previous_reminder_interval': 24})
+        self.assertEqual(Employee.objects.get(employee_id='0').reminder_interval, 24)
+        response = self.client.get(f'/departments/{self.department.pk}/reminder-interval-preview/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cascade(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/departments/{self.department.pk}/', {'reminder_interval': 13},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "polls_employee"')]), 1)
+        employees = {employee.employee_id: employee for employee in Employee.objects.all()}
+        self.assertEqual((employees['0'].reminder_interval, employees['0'].next_reminder), (13, date(2021, 2, 28)))
+        self.assertEqual((employees['1'].reminder_interval, employees['1'].next_reminder), (13, date(2019, 1, 1)))
+        # individual intervals and other departments are left alone
+        self.assertEqual((employees['2'].reminder_interval, employees['2'].next_reminder), (6, date(2020, 7, 1)))
+        self.assertEqual((employees['3'].reminder_interval, employees['3'].next_reminder), (24, date(2022, 1, 1)))
+
+
+class SchedulerApiTest(AuthenticatedApiTestCase):
+    """
+    API test case for the automatic scheduling of appointments.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa", reminder_interval=24)
+        self.due = [self.create_employee(f'due{i}', date(2030, 2, 1) + timedelta(days=i), department)
+                    for i in range(5)]
+        self.create_employee('inactive', date(2030, 1, 1), department, active=False)
+        self.create_employee('unwilling', date(2030, 1, 1), department, wants_reminder=False)
+        # already has an appointment on the first day, which takes its only slot
+        booked = self.create_employee('booked', date(2030, 1, 1), department)
+        Appointment.objects.create(employee=booked, date=date(2030, 3, 4))
+        self.create_employee('late', date(2030, 4, 10), department)
+
+    @staticmethod
+    def create_employee(employee_id, next_reminder, department, **kwargs):
+        return Employee.objects.create(employee_id=employee_id, first_name='J', last_name='Lo',
+                                       date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                       next_reminder=next_reminder, reminder_interval=24, department=department,
+                                       **kwargs)
+
+    def test_schedule_api(self):
+        response = self.client.post('/appointments/schedule/', {'start': '04.03.2030', 'end': '05.03.2030',
+                                                                'capacity': 1, 'dry_run': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['appointments'], [{'employee': self.due[0].pk, 'date': '05.03.2030'}])
+        self.assertEqual(len(response.json()['unscheduled']), 4)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        response = self.client.post('/appointments/schedule/', {'start': '04.03.2030', 'end': '05.03.2030',
+                                                                'capacity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.filter(employee=self.due[0]).get().date, date(2030, 3, 5))
+
+        response = self.client.post('/appointments/schedule/', {'start': '05.03.2030', 'end': '04.03.2030'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AppointmentCalendarTest(AuthenticatedApiTestCase):
+    """
+    API test case for the appointment calendar.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name="Mensa")
+        self.employee = Employee.objects.create(employee_id='1', first_name='J', last_name='Lo',
+                                                date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                                department=self.department)
+        self.other_department = Department.objects.create(name="IT")
+        other = Employee.objects.create(employee_id='2', first_name='J', last_name='Lo',
+                                        date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                        department=self.other_department)
+        colleague = Employee.objects.create(employee_id='3', first_name='J', last_name='Lo',
+                                            date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                            department=self.department)
+        for employee, day, confirmed in [(self.employee, date(2020, 2, 3), True),
+                                         (colleague, date(2020, 2, 3), False), (other, date(2020, 2, 3), False),
+                                         (other, date(2020, 2, 29), True), (other, date(2020, 3, 1), True)]:
+            Appointment.objects.create(employee=employee, date=day, confirmed=confirmed)
+
+    def test_month(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/appointments/calendar/?month=2020-02')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if 'polls_appointment' in query['sql']]), 1)
+        data = response.json()
+        self.assertEqual((data['start'], data['end'], data['total'], data['confirmed'], data['unconfirmed']),
+                         ('01.02.2020', '29.02.2020', 4, 2, 2))
+        self.assertEqual(len(data['days']), 29)
+        self.assertEqual(data['days'][0], {'date': '01.02.2020', 'total': 0, 'confirmed': 0, 'unconfirmed': 0})
+        self.assertEqual(data['days'][2], {'date': '03.02.2020', 'total': 3, 'confirmed': 1, 'unconfirmed': 2})
+        self.assertEqual(self.client.get('/appointments/calendar/?month=02.2020').json(), data)
+
+    def test_range_by_department(self):
+        response = self.client.get('/appointments/calendar/?start=03.02.2020&end=2020-02-04&by_department=true'
+                                   f'&employee={self.employee.pk}')
+        self.assertEqual(response.json()['days'], [
+            {'date': '03.02.2020', 'total': 1, 'confirmed': 1, 'unconfirmed': 0,
+             'departments': [{'department': self.department.pk, 'total': 1, 'confirmed': 1, 'unconfirmed': 0}]},
+            {'date': '04.02.2020', 'total': 0, 'confirmed': 0, 'unconfirmed': 0, 'departments': []}])
+        response = self.client.get('/appointments/calendar/?start=03.02.2020&end=03.02.2020&by_department=true')
+        self.assertEqual(response.json()['days'][0]['departments'], [
+            {'department': self.department.pk, 'total': 2, 'confirmed': 1, 'unconfirmed': 1},
+            {'department': self.other_department.pk, 'total': 1, 'confirmed': 0, 'unconfirmed': 1}])
+
+    def test_conditional_get(self):
+        response = self.client.get('/appointments/calendar/?month=2020-02')
+        response = self.client.get('/appointments/calendar/?month=2020-02', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_period(self):
+        for query in ['month=2020-13', 'start=01.02.2020', 'start=01.02.2020&end=31.01.2020',
+                      'start=01.02.2020&end=01.02.2021']:
+            self.assertEqual(self.client.get(f'/appointments/calendar/?{query}').status_code, 400, query)
+
+
+class ICalendarFeedTest(AuthenticatedApiTestCase):
+    """
+    API test case for the iCalendar feed of appointments.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name="Mensa, Küche")
+        employee = Employee.objects.create(employee_id='1', first_name='Jö', last_name='Lo',
+                                           date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                           department=self.department)
+        other = Employee.objects.create(employee_id='2', first_name='J', last_name='Lo',
+                                        date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                        department=Department.objects.create(name="IT"))
+        self.appointment = Appointment.objects.create(employee=employee, date=date(2020, 2, 29), confirmed=True,
+                                                      note='Bitte nüchtern erscheinen;\n' + 'x' * 100)
+        Appointment.objects.create(employee=other, date=date(2020, 3, 1))
+
+    def get_feed(self, query='', **headers):
+        response = self.client.get(f'/appointments/ics/{query}', HTTP_ACCEPT='text/calendar', **headers)
+        body = b''.join(response.streaming_content).decode('utf-8') if response.status_code == 200 else None
+        return response, body
+
+    def test_feed(self):
+        response, body = self.get_feed(f'?department={self.department.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'))
+        self.assertTrue(body.endswith('END:VEVENT\r\nEND:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        for line in [f'UID:appointment-{self.appointment.pk}@testserver', 'DTSTART;VALUE=DATE:20200229',
+                     'DTEND;VALUE=DATE:20200301', 'SUMMARY:Jö Lo (1)', 'CATEGORIES:Mensa\\, Küche',
+                     'STATUS:CONFIRMED']:
+            self.assertIn(line + '\r\n', body)
+        self.assertTrue(all(len(line.encode('utf-8')) <= 75 for line in body.split('\r\n')))
+        unfolded = body.replace('\r\n ', '')
+        self.assertIn('DESCRIPTION:Bitte nüchtern erscheinen\\;\\n' + 'x' * 100 + '\r\n', unfolded)
+
+    def test_date_range(self):
+        _, body = self.get_feed('?min_date=2020-03-01')
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn('STATUS:TENTATIVE', body)
+
+    def test_conditional_get(self):
+        response, _ = self.get_feed()
+        etag = response['ETag']
+        response, _ = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # renaming a department changes the events
+        self.department.name = 'Mensa'
+        self.department.save()
+        response, _ = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ReminderForecastApiTest(AuthenticatedApiTestCase):
+    """
+    API test case for the forecast of reminders per department and month.
+    """
+
+    def test_endpoint(self):
+        response = self.client.get('/employees/forecast/?months=36')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['months']), 36)
+        self.assertEqual(response.json()['months'][0], timezone.localdate().strftime('%m.%Y'))
+        self.assertEqual(self.client.get('/employees/forecast/?months=37').status_code, 400)
+
+
+class DoubleBookingTest(AuthenticatedApiTestCase):
+    """
+    API test case for preventing and detecting double bookings of appointments.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        self.first, self.second = [
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name='Lo', date_of_birth=date(1990, 1, 1),
+                                    date_of_entry=date(2019, 1, 1), department=department) for i in range(2)]
+        self.booked = Appointment.objects.create(employee=self.first, date=date(2020, 3, 2))
+
+    def test_create_and_update(self):
+        response = self.client.post('/appointments/', {'employee': self.first.pk, 'date': '02.03.2020'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+        other = Appointment.objects.create(employee=self.first, date=date(2020, 3, 3))
+        response = self.client.patch(f'/appointments/{other.pk}/', {'date': '02.03.2020'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/appointments/{other.pk}/', {'employee': self.second.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_rejects_duplicates(self):
+        batch = [{'employee': self.first.pk, 'date': '02.03.2020'}, {'employee': self.second.pk, 'date': '02.03.2020'},
+                 {'employee': self.second.pk, 'date': '03.03.2020'}, {'employee': self.second.pk, 'date': '2020-03-03'}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/appointments/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [0, 2, 3])
+        self.assertEqual(len([query for query in queries if 'FROM "polls_appointment"' in query['sql']]), 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        response = self.client.patch('/appointments/bulk/', [{'id': self.booked.pk, 'employee': self.second.pk},
+                                                             {'id': self.booked.pk, 'note': 'moved'}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Appointment.objects.get(pk=self.booked.pk).employee, self.second)
+
+    def test_bulk_merges_duplicates(self):
+        batch = [{'employee': self.first.pk, 'date': '02.03.2020'}, {'employee': self.second.pk, 'date': '03.03.2020'},
+                 {'employee': self.second.pk, 'date': '2020-03-03'}]
+        response = self.client.post('/appointments/bulk/?duplicates=merge', batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['merged'], [0, 2])
+        self.assertEqual([appointment['employee'] for appointment in response.json()['results']], [self.second.pk])
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_conflicts(self):
+        batch = [{'employee': self.first.pk, 'date': '01.03.2020'}, {'employee': self.first.pk, 'date': '02.03.2020'},
+                 {'employee': self.second.pk, 'date': '02.03.2020'}, {'employee': self.second.pk, 'date': '2020-03-02'}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/appointments/conflicts/', batch, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if 'FROM "polls_appointment"' in query['sql']]), 1)
+        self.assertEqual(response.json()['conflicts'], [
+            {'index': 1, 'employee': self.first.pk, 'date': '02.03.2020', 'appointment': self.booked.pk,
+             'duplicate_of': None},
+            {'index': 3, 'employee': self.second.pk, 'date': '02.03.2020', 'appointment': None, 'duplicate_of': 2}])
+        response = self.client.post('/appointments/conflicts/', [{'employee': self.first.pk}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class DepartmentStatsApiTest(AuthenticatedApiTestCase):
+    """
+    API test case for the department statistics of the department endpoints.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.mensa = Department.objects.create(name="Mensa")
+        self.it = Department.objects.create(name="IT")
+        for i, department in enumerate([self.mensa, self.mensa, self.it]):
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name='Lo', date_of_birth=date(1990, 1, 1),
+                                    date_of_entry=date(2019, 1, 1), department=department)
+
+    def test_reads_do_not_rebuild(self):
+        Employee.objects.filter(department=self.mensa).update(active=False)
+        self.assertTrue(self.client.get(f'/departments/{self.mensa.pk}/').json()['stats']['stale'])
+        self.assertTrue(DepartmentStats.objects.get(pk=self.mensa.pk).stale)
+        refresh_department_stats()
+        stats = self.client.get(f'/departments/{self.mensa.pk}/').json()['stats']
+        self.assertEqual({counter: stats[counter] for counter in DEPARTMENT_STATS_COUNTERS},
+                         {'active_employees': 0, 'due_soon': 0, 'overdue': 0, 'appointments_this_year': 0})
+        self.assertFalse(stats['stale'])
+
+    def test_list_reads_counters(self):
+        for i in range(10):
+            Employee.objects.create(employee_id=f'more{i}', first_name='J', last_name='Lo',
+                                    date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                    department=self.it)
+        with CaptureQueriesContext(connection) as queries:
+            departments = self.client.get('/departments/?employees=ids').json()
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        self.assertEqual({department['name']: department['stats']['active_employees'] for department in departments},
+                         {'IT': 11, 'Mensa': 2})
@@ -0,0 +1,161 @@
+import random
+import re
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from polls.models import Appointment, Department, Employee
+from polls.reminders import due_reminders_queryset
+from polls.serializers import AppointmentCalendarSerializer
+from polls.views import EmployeeViewSet, AppointmentViewSet
+
+# See https://www.sqlite.org/eqp.html
+
+# Running these tests: python manage.py test polls.test.tests_query_plan
+
+# Matches plan lines like "SCAN polls_employee" or "SCAN TABLE polls_employee" (older SQLite versions),
+# but not "SCAN polls_employee USING INDEX ..." which walks an index instead of the table.
+FULL_TABLE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(polls_\w+)(?! USING (?:COVERING )?INDEX)\b')
+
+
+def list_queryset(viewset_class, query_params=None):
+    """
+    Returns the queryset the given viewset would evaluate for a list request with the given query parameters.
+    """
+    request = Request(APIRequestFactory().get('/', query_params or {}))
+    view = viewset_class(request=request, format_kwarg=None, action='list')
+    return view.filter_queryset(view.get_queryset())
+
+
+def seed(employees=2000, appointments_per_employee=3):
+    """
+    Creates employees and appointments with representative value distributions and collects the statistics
+    the query planner of SQLite bases its choices on, so that plans are not those of empty tables.
+    """
+    rng = random.Random(0)
+    Department.objects.bulk_create([Department(name=name) for name in ['Mensa', 'IT', 'Verwaltung']])
+    departments = list(Department.objects.all())
+    now = timezone.now()
+    Employee.objects.bulk_create([Employee(
+        employee_id=f'seed{i}', first_name='J', last_name=f'{chr(65 + rng.randrange(26))}{rng.randrange(10 ** 6)}',
+        date_of_birth=date(1960, 1, 1) + timedelta(days=rng.randrange(15000)),
+        date_of_entry=date(2000, 1, 1) + timedelta(days=rng.randrange(7000)),
+        next_reminder=date(2018, 1, 1) + timedelta(days=rng.randrange(5 * 365)),
+        active=rng.random() < 0.9, wants_reminder=rng.random() < 0.95, department=rng.choice(departments),
+    ) for i in range(employees)], batch_size=500)
+    # bulk_update does not apply auto_now, so the modifications are spread over the last two years
+    seeded = list(Employee.objects.filter(employee_id__startswith='seed').only('id'))
+    for employee in seeded:
+        employee.updated_at = now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+    Employee.objects.bulk_update(seeded, ['updated_at'], batch_size=500)
+    Appointment.objects.bulk_create([
+        Appointment(employee=employee, date=date(2015, 1, 1) + timedelta(days=day))
+        for employee in seeded for day in rng.sample(range(7 * 365), appointments_per_employee)
+    ], batch_size=500)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Base test case asserting that list queries are served by an index, on tables holding representative data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+
+    def assertNoFullTableScan(self, queryset):
+        plan = queryset.explain()
+        match = FULL_TABLE_SCAN.search(plan)
+        if match:
+            self.fail(f'Query falls back to a full table scan of {match.group(1)}.\n'
+                      f'Query: {queryset.query}\nPlan:\n{plan}')
+
+
+class EmployeeQueryPlanTest(QueryPlanTestCase):
+    """
+    Query plan test case for the `polls.views.EmployeeViewSet` list endpoint.
+    """
+
+    def test_keyset_page(self):
+        # The ordering applied by `polls.pagination.KeysetPagination`
+        queryset = list_queryset(EmployeeViewSet).order_by('last_name', 'id')
+        self.assertNoFullTableScan(queryset.filter(last_name__gt='M')[:200])
+
+    def test_due_reminders(self):
+        # The filter sent by the home dashboard
+        self.assertNoFullTableScan(list_queryset(EmployeeViewSet, {
+            'active': 'true',
+            'wants_reminder': 'true',
+            'reminder_after': '2020-01-01',
+            'reminder_before': '2020-03-01',
+        }))
+
+    def test_due_endpoint(self):
+        plan = due_reminders_queryset().explain()
+        self.assertNoFullTableScan(due_reminders_queryset())
+        self.assertNotIn('TEMP B-TREE', plan, f'Due reminders are sorted instead of read in index order.\n{plan}')
+
+    def test_reminder_window(self):
+        self.assertNoFullTableScan(list_queryset(EmployeeViewSet, {
+            'reminder_after': '2020-01-01',
+            'reminder_before': '2020-03-01',
+        }))
+
+    def test_reminder_before(self):
+        self.assertNoFullTableScan(list_queryset(EmployeeViewSet, {'reminder_before': '2020-03-01'}))
+
+    def test_updated_since(self):
+        # older deltas are answered with the full list, see `polls.views.DeltaSyncMixin`
+        updated_since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertNoFullTableScan(list_queryset(EmployeeViewSet, {'updated_since': updated_since}))
+
+    def test_active(self):
+        self.assertNoFullTableScan(list_queryset(EmployeeViewSet, {'active': 'false'}))
+
+
+class AppointmentQueryPlanTest(QueryPlanTestCase):
+    """
+    Query plan test case for the `polls.views.AppointmentViewSet` list endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.employee = Employee.objects.filter(employee_id__startswith='seed').first()
+
+    def test_keyset_page(self):
+        queryset = list_queryset(AppointmentViewSet).order_by('date', 'id')
+        self.assertNoFullTableScan(queryset.filter(date__gt='2020-01-01')[:200])
+
+    def test_employee(self):
+        self.assertNoFullTableScan(list_queryset(AppointmentViewSet, {'employee': self.employee.pk}))
+
+    def test_employee_date_range(self):
+        self.assertNoFullTableScan(list_queryset(AppointmentViewSet, {
+            'employee': self.employee.pk,
+            'min_date': '2020-01-01',
+            'max_date': '2020-12-31',
+        }))
+
+    def test_date_range(self):
+        self.assertNoFullTableScan(list_queryset(AppointmentViewSet, {
+            'min_date': '2020-01-01',
+            'max_date': '2020-12-31',
+        }))
+
+    def test_calendar(self):
+        serializer = AppointmentCalendarSerializer(data={'month': '2020-02'})
+        serializer.is_valid(raise_exception=True)
+        self.assertNoFullTableScan(serializer.counts(list_queryset(AppointmentViewSet)))
+
+    def test_conflicts(self):
+        # the query of `polls.bulk.find_conflicts`
+        self.assertNoFullTableScan(Appointment.objects.filter(
+            employee__in=[self.employee.pk], date__in=['2020-01-01', '2020-01-02']
+        ).values_list('employee', 'date', 'pk'))
@@ -5,12 +5,30 @@ from django.utils import timezone
 from django.test import TestCase
 from rest_framework.renderers import JSONRenderer
 from rest_framework.parsers import JSONParser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from polls.test.resource import MOCK_DEPARTMENTS, MOCK_EMPLOYEE_BIANCA
+from datetime import date, timedelta
 import io
+import json
+import os
+from unittest import mock
 
-from polls.models import Employee, Department, Appointment, Template, Account
+from polls.jobs import submit_job, claim_jobs, fail_job, finish_job, expire_jobs, run_worker
+from polls.models import Employee, Department, Appointment, Template, Account, PdfJob, DepartmentStats
 from polls.serializers import EmployeeSerializer, DepartmentSerializer, AppointmentSerializer, TemplateSerializer, \
     AccountSerializer
+from polls.reminders import recompute_next_reminders, reminder_forecast
+from polls import renderers
+from polls.scheduler import DaySlots, schedulable_days, schedule_appointments
+from polls.stats import reconcile_department_stats, refresh_department_stats
+from polls.letter_cache import LetterCache, letter_cache
+from polls.utils import CompiledTemplateCache, COVER_LETTER_TEMPLATE, render_cover_letters_serially
+from polls.views import AppointmentViewSet
+from polls.bulk import AppointmentBulkWriter
+from polls.test.base import TemporaryLetterCacheMixin
 
 
 # See https://docs.djangoproject.com/en/2.2/topics/testing/
@@ -159,6 +177,50 @@ class AppointmentSerializerTest(TestCase):
         content = JSONRenderer().render(serializer.data)
         print(f"Serialized:\n{content}")
 
+    def create_employee(self):
+        Department.objects.filter(name="Mensa").update(reminder_interval=12)
+        return Employee.objects.create(employee_id='23', first_name='Jay', last_name='Z', reminder_interval=12,
+                                       date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                       department=Department.objects.get(name="Mensa"))
+
+    def test_create_appointment_maintains_last_appointment_date(self):
+        e = self.create_employee()
+        for day in ["01.03.2020", "01.02.2020"]:
+            serializer = AppointmentSerializer(data={'date': day, 'employee': e.pk})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        e.refresh_from_db()
+        self.assertEqual(e.last_appointment_date, date(2020, 3, 1))
+        self.assertEqual(e.next_reminder, date(2021, 3, 1))
+
+    def test_update_and_delete_appointment_recompute_last_appointment_date(self):
+        e = self.create_employee()
+        earlier = Appointment.objects.create(employee=e, date=date(2020, 1, 1))
+        serializer = AppointmentSerializer(data={'date': "01.03.2020", 'employee': e.pk})
+        serializer.is_valid(raise_exception=True)
+        latest = serializer.save()
+
+        serializer = AppointmentSerializer(latest, data={'date': "01.02.2020"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        e.refresh_from_db()
+        self.assertEqual(e.last_appointment_date, date(2020, 2, 1))
+        self.assertEqual(e.next_reminder, date(2021, 2, 1))
+
+        AppointmentViewSet().perform_destroy(latest)
+        AppointmentViewSet().perform_destroy(earlier)
+        e.refresh_from_db()
+        self.assertIsNone(e.last_appointment_date)
+        self.assertEqual(e.next_reminder, e.date_of_entry)
+
+    def test_rebuild_last_appointment_dates_command(self):
+        e = self.create_employee()
+        Appointment.objects.create(employee=e, date=date(2020, 1, 1))
+        Appointment.objects.create(employee=e, date=date(2020, 5, 1))
+        call_command('rebuild_last_appointment_dates', stdout=io.StringIO())
+        e.refresh_from_db()
+        self.assertEqual(e.last_appointment_date, date(2020, 5, 1))
+
 
 class DepartmentSerializerTest(TestCase):
     """
@@ -173,6 +235,398 @@ class DepartmentSerializerTest(TestCase):
         print(f"Serialized:\n{content}")
 
 
+class FastJSONRendererTest(TestCase):
+    """
+    Unit test case for the JSON renderer and parser of `polls.renderers`.
+    """
+
+    DATA = {'date': date(2020, 3, 1), 'text': 'Grüße\u2028', 'ids': [1, 2], 1: None}
+
+    def test_render(self):
+        for fast_library in [renderers.orjson, None]:
+            with mock.patch.object(renderers, 'orjson', fast_library):
+                rendered = renderers.FastJSONRenderer().render(self.DATA)
+                self.assertEqual(json.loads(rendered), {'date': '01.03.2020', 'text': 'Grüße\u2028', 'ids': [1, 2],
+                                                        '1': None})
+                self.assertNotIn(b'\xe2\x80\xa8', rendered)
+                self.assertEqual(renderers.FastJSONParser().parse(io.BytesIO(rendered))['date'], '01.03.2020')
+
+
+class ReminderEngineTest(TestCase):
+    """
+    Unit test case for the set-based recomputation of the next reminders.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(name="Mensa")
+        for i, (last_appointment_date, reminder_interval) in enumerate([(None, 24), (date(2020, 1, 31), 1),
+                                                                       (date(2020, 3, 31), -1), (date(2019, 5, 15), 12),
+                                                                       (date(2019, 8, 31), 6)]):
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                    date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                    last_appointment_date=last_appointment_date,
+                                    reminder_interval=reminder_interval, department=department)
+
+    def test_add_months_matches_monthdelta(self):
+        self.assertEqual(Employee.objects.all().recompute_next_reminder(), 5)
+        for employee in Employee.objects.all():
+            self.assertEqual(employee.next_reminder, employee.derive_next_reminder())
+        self.assertEqual(Employee.objects.get(employee_id='1').next_reminder, date(2020, 2, 29))
+
+    def test_department_interval_without_own_interval(self):
+        Employee.objects.all().recompute_next_reminder()
+        employee = Employee.objects.get(employee_id='2')
+        self.assertEqual(employee.applicable_reminder_interval(), 24)
+        self.assertEqual(employee.next_reminder, date(2022, 3, 31))
+
+    def test_recompute_command_in_chunks(self):
+        Employee.objects.filter(employee_id__in=['0', '1']).recompute_next_reminder()
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('recompute_reminders', '--chunk-size', '2', stdout=out)
+        self.assertIn('Changed the next reminder of 3 employees', out.getvalue())
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "polls_employee"')]), 3)
+        out = io.StringIO()
+        call_command('recompute_reminders', stdout=out)
+        self.assertIn('Changed the next reminder of 0 employees', out.getvalue())
+
+    def test_rebuild_last_appointment_dates(self):
+        employee = Employee.objects.get(employee_id='0')
+        Appointment.objects.bulk_create([Appointment(employee=employee, date=date(2020, 6, 15))])
+        recompute_next_reminders(rebuild_last_appointment_dates=True)
+        employee.refresh_from_db()
+        self.assertEqual(employee.next_reminder, date(2022, 6, 15))
+
+
+class ReminderForecastTest(TestCase):
+    """
+    Unit test case for the forecast of reminders per department and month.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.mensa = Department.objects.create(name="Mensa", reminder_interval=6)
+        self.it = Department.objects.create(name="IT", reminder_interval=24)
+        for i, (department, next_reminder, reminder_interval, kwargs) in enumerate([
+                (self.mensa, date(2020, 3, 10), 12, {}),
+                # overdue, with the interval of the department
+                (self.mensa, date(2019, 11, 1), 0, {}),
+                (self.mensa, date(2020, 3, 10), 12, {'active': False}),
+                (self.mensa, date(2020, 3, 10), 12, {'wants_reminder': False}),
+                (self.it, date(2021, 12, 31), 24, {}),
+                (self.it, date(2022, 1, 1), 24, {})]):
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name='Lo', date_of_birth=date(1990, 1, 1),
+                                    date_of_entry=date(2019, 1, 1), next_reminder=next_reminder,
+                                    reminder_interval=reminder_interval, department=department, **kwargs)
+
+    def test_forecast(self):
+        forecast = reminder_forecast(24, start=date(2020, 1, 15))
+        self.assertEqual(forecast['months'][:2], ['01.2020', '02.2020'])
+        self.assertEqual(forecast['months'][-1], '12.2021')
+        mensa = [0] * 24
+        for month in [2, 14, 0, 6, 12, 18]:
+            mensa[month] += 1
+        it = [0] * 23 + [1]
+        self.assertEqual(forecast['departments'], [{'id': self.it.pk, 'name': 'IT', 'reminders': it},
+                                                   {'id': self.mensa.pk, 'name': 'Mensa', 'reminders': mensa}])
+        self.assertEqual(forecast['total'], [a + b for a, b in zip(mensa, it)])
+
+    def test_cached_until_next_write(self):
+        forecast = reminder_forecast(12, start=date(2020, 1, 1))
+        with self.assertNumQueries(1):
+            self.assertEqual(reminder_forecast(12, start=date(2020, 1, 1)), forecast)
+        Appointment.objects.create(employee=Employee.objects.get(employee_id='1'), date=date(2020, 1, 2))
+        with self.assertNumQueries(3):
+            reminder_forecast(12, start=date(2020, 1, 1))
+        Employee.objects.filter(employee_id='1').update(next_reminder=date(2020, 7, 2))
+        self.assertNotEqual(reminder_forecast(12, start=date(2020, 1, 1)), forecast)
+
+    def test_cached_until_department_write(self):
+        forecast = reminder_forecast(12, start=date(2020, 1, 1))
+        self.mensa.reminder_interval = 3
+        self.mensa.save()
+        self.assertNotEqual(reminder_forecast(12, start=date(2020, 1, 1)), forecast)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('forecast_reminders', months=3, stdout=out)
+        self.assertIn('Total', out.getvalue())
+
+
+class DepartmentStatsTest(TestCase):
+    """
+    Unit test case for the incrementally maintained department statistics.
+    """
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.this_year, self.last_year = date(today.year, 1, 1), date(today.year - 1, 6, 1)
+        self.mensa = Department.objects.create(name="Mensa")
+        self.it = Department.objects.create(name="IT")
+        self.due, self.overdue, self.inactive, self.other = [
+            Employee.objects.create(employee_id=str(i), first_name='J', last_name='Lo', date_of_birth=date(1990, 1, 1),
+                                    date_of_entry=date(2019, 1, 1), department=department,
+                                    next_reminder=today + timedelta(days=days), active=active)
+            for i, (department, days, active) in enumerate([(self.mensa, 5, True), (self.mensa, -5, True),
+                                                            (self.mensa, -5, False), (self.it, 100, True)])]
+        self.appointment = Appointment.objects.create(employee=self.overdue, date=self.this_year)
+        Appointment.objects.create(employee=self.other, date=self.last_year)
+
+    def counters(self):
+        return {stats.department_id: (stats.active_employees, stats.due_soon, stats.overdue,
+                                      stats.appointments_this_year, stats.stale)
+                for stats in DepartmentStats.objects.all()}
+
+    def assertConsistent(self):
+        counters = self.counters()
+        reconcile_department_stats()
+        self.assertEqual(counters, self.counters())
+
+    def test_created(self):
+        self.assertEqual(self.counters(), {self.mensa.pk: (2, 1, 1, 1, False), self.it.pk: (1, 0, 0, 0, False)})
+        self.assertConsistent()
+
+    def test_employee_changes(self):
+        self.due.active = False
+        self.due.save()
+        self.overdue.department = self.it
+        self.overdue.save()
+        self.other.delete()
+        self.assertEqual(self.counters(), {self.mensa.pk: (0, 0, 0, 0, False), self.it.pk: (1, 0, 1, 1, False)})
+        self.assertConsistent()
+
+    def test_appointment_changes(self):
+        self.appointment.employee = self.other
+        self.appointment.save()
+        self.assertEqual(self.counters()[self.it.pk][3], 1)
+        self.appointment.date = self.last_year + timedelta(days=1)
+        self.appointment.save()
+        self.assertEqual(self.counters()[self.it.pk][3], 0)
+        Appointment.objects.create(employee=self.due, date=self.this_year)
+        Appointment.objects.get(employee=self.other, date=self.last_year).delete()
+        self.assertEqual(self.counters()[self.mensa.pk][3], 1)
+        self.assertConsistent()
+
+    def test_state_fetched_on_save(self):
+        employee = Employee.objects.get(pk=self.due.pk)
+        self.assertFalse(hasattr(employee, '_stats_state'))
+        employee.notes = 'allergic'
+        # neither fetches the stored state nor changes the counters
+        with self.assertNumQueries(2):
+            employee.save(update_fields=['notes', 'updated_at'])
+        employee.next_reminder = None
+        with CaptureQueriesContext(connection) as queries:
+            employee.save()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 1)
+        self.assertEqual(self.counters()[self.mensa.pk][:3], (2, 0, 1))
+        self.assertConsistent()
+
+    def test_set_based_writes_mark_stale(self):
+        Employee.objects.filter(pk=self.due.pk).update(next_reminder=timezone.localdate() - timedelta(days=1))
+        self.assertEqual(self.counters()[self.mensa.pk][-1], True)
+        self.assertEqual(self.counters()[self.it.pk][-1], False)
+        # not counted
+        Employee.objects.filter(pk=self.other.pk).update(notes='allergic')
+        self.assertEqual(self.counters()[self.it.pk][-1], False)
+
+        self.assertEqual(len(refresh_department_stats()), 1)
+        self.assertEqual(self.counters()[self.mensa.pk], (2, 0, 2, 1, False))
+
+        AppointmentBulkWriter().create([{'employee_id': self.other.pk, 'date': date(2000, 1, 1)}])
+        self.assertEqual(self.counters()[self.it.pk][-1], True)
+
+    def test_new_day(self):
+        DepartmentStats.objects.update(computed_on=date(2000, 1, 1))
+        self.due.active = False
+        self.due.save()
+        refresh_department_stats()
+        self.assertEqual(self.counters()[self.mensa.pk], (1, 0, 1, 1, False))
+
+    def test_command(self):
+        DepartmentStats.objects.all().delete()
+        out = io.StringIO()
+        call_command('reconcile_department_stats', stdout=out)
+        self.assertIn('2 departments', out.getvalue())
+        self.assertEqual(self.counters(), {self.mensa.pk: (2, 1, 1, 1, False), self.it.pk: (1, 0, 0, 0, False)})
+
+    def test_command_stale(self):
+        Employee.objects.filter(pk=self.other.pk).update(active=False)
+        out = io.StringIO()
+        call_command('reconcile_department_stats', '--stale', stdout=out)
+        self.assertIn('1 departments', out.getvalue())
+        self.assertEqual(self.counters()[self.it.pk], (0, 0, 0, 0, False))
+
+
+class SchedulerTest(TestCase):
+    """
+    Unit test case for the automatic scheduling of appointments.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(name="Mensa", reminder_interval=24)
+        self.due = []
+        # created in reverse order of urgency to make sure employees are ordered by next_reminder
+        for i in reversed(range(5)):
+            self.due.insert(0, self.create_employee(f'due{i}', date(2030, 2, 1) + timedelta(days=i), department))
+        self.create_employee('inactive', date(2030, 1, 1), department, active=False)
+        self.create_employee('unwilling', date(2030, 1, 1), department, wants_reminder=False)
+        # already has an appointment on the first day, which takes one of its slots
+        booked = self.create_employee('booked', date(2030, 1, 1), department)
+        Appointment.objects.create(employee=booked, date=date(2030, 3, 4))
+        # its reminder is displayed on Sunday, 10.03.2030
+        self.late = self.create_employee('late', date(2030, 4, 10), department)
+
+    @staticmethod
+    def create_employee(employee_id, next_reminder, department, **kwargs):
+        return Employee.objects.create(employee_id=employee_id, first_name='J', last_name='Lo',
+                                       date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                       next_reminder=next_reminder, reminder_interval=24, department=department,
+                                       **kwargs)
+
+    def test_day_slots(self):
+        days = [date(2030, 3, 4), date(2030, 3, 5), date(2030, 3, 6)]
+        slots = DaySlots(days, [1, 0, 2])
+        self.assertEqual([slots.take(date(2030, 3, 1)) for _ in range(4)], days[:1] + days[2:] * 2 + [None])
+
+    def test_schedulable_days(self):
+        self.assertEqual(schedulable_days(date(2030, 3, 8), date(2030, 3, 11)), [date(2030, 3, 8), date(2030, 3, 11)])
+        self.assertEqual(len(schedulable_days(date(2030, 3, 8), date(2030, 3, 11), weekdays=range(7))), 4)
+
+    def test_schedule(self):
+        planned, unscheduled = schedule_appointments(date(2030, 3, 4), date(2030, 3, 11), capacity=2,
+                                                     reminder_before=date(2030, 4, 30))
+        self.assertEqual(planned, [(self.due[0].pk, date(2030, 3, 4)), (self.due[1].pk, date(2030, 3, 5)),
+                                   (self.due[2].pk, date(2030, 3, 5)), (self.due[3].pk, date(2030, 3, 6)),
+                                   (self.due[4].pk, date(2030, 3, 6)), (self.late.pk, date(2030, 3, 11))])
+        self.assertEqual(unscheduled, [])
+        self.assertEqual(Appointment.objects.count(), 7)
+        employee = Employee.objects.get(pk=self.due[0].pk)
+        self.assertEqual((employee.last_appointment_date, employee.next_reminder), (date(2030, 3, 4), date(2032, 3, 4)))
+
+    def test_schedule_without_capacity(self):
+        planned, unscheduled = schedule_appointments(date(2030, 3, 4), date(2030, 3, 5), capacity=2)
+        self.assertEqual([employee_id for employee_id, _ in planned], [employee.pk for employee in self.due[:3]])
+        self.assertEqual(unscheduled, [employee.pk for employee in self.due[3:]])
+
+
+class TemplateCacheTest(TestCase):
+    """
+    Unit test case for the compiled template cache used by `polls.utils.fill_template`.
+    """
+
+    def test_eviction(self):
+        cache = CompiledTemplateCache(max_size=1)
+        cache.get(1, "a")
+        cache.get(2, "b")
+        cache.get(1, "a")
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertEqual(cache.stats()['size'], 1)
+
+
+class LetterCacheTest(TemporaryLetterCacheMixin, TestCase):
+    """
+    Unit test case for the on-disk cache of rendered cover letters.
+    """
+
+    def render(self, template_src, context_dict):
+        self.renders += 1
+        return f'{context_dict["employee"]["last_name"]}'.encode() * 100
+
+    def setUp(self):
+        super().setUp()
+        self.renders = 0
+        self.context = {'employee': {'first_name': 'J', 'last_name': 'Lo'}, 'today': timezone.now()}
+
+    def test_hit(self):
+        first = letter_cache.get_or_render(COVER_LETTER_TEMPLATE, self.context, 'pdf', self.render)
+        self.context['today'] = timezone.now()
+        second = letter_cache.get_or_render(COVER_LETTER_TEMPLATE, self.context, 'pdf', self.render)
+        self.assertEqual(first, second)
+        self.assertEqual(self.renders, 1)
+
+    def test_employee_change(self):
+        letter_cache.get_or_render(COVER_LETTER_TEMPLATE, self.context, 'pdf', self.render)
+        self.context['employee']['last_name'] = 'Z'
+        self.assertEqual(letter_cache.get_or_render(COVER_LETTER_TEMPLATE, self.context, 'pdf', self.render),
+                         b'Z' * 100)
+        self.assertEqual(self.renders, 2)
+
+    def test_eviction(self):
+        cache = LetterCache(letter_cache.directory, max_bytes=250)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, b'x' * 100)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_scans_only_when_full(self):
+        cache = LetterCache(letter_cache.directory, max_bytes=1000)
+        with mock.patch.object(cache, 'entries', wraps=cache.entries) as entries:
+            for i in range(10):
+                cache.put(str(i), b'x' * 90)
+            self.assertEqual(entries.call_count, 1)
+            cache.put('0', b'x' * 90)
+            cache.put('full', b'x' * 150)
+            self.assertEqual(entries.call_count, 2)
+        self.assertLessEqual(cache.size, 900)
+        self.assertEqual(cache.size, sum(size for _, size, _ in cache.entries()))
+
+
+def render_or_crash(contexts):
+    # stands in for polls.utils.render_cover_letters_serially in the worker processes
+    if contexts[0]['employee']['last_name'] == 'Crash':
+        os._exit(1)
+    return render_cover_letters_serially(contexts)
+
+
+class PdfJobTest(TemporaryLetterCacheMixin, TestCase):
+    """
+    Unit test case for the background PDF job queue.
+    """
+
+    def setUp(self):
+        super().setUp()
+        department = Department.objects.create(name="Mensa")
+        self.employees = [Employee.objects.create(employee_id=str(i), first_name='J', last_name=f'Lo{i}',
+                                                  date_of_birth=date(1990, 1, 1), date_of_entry=date(2019, 1, 1),
+                                                  department=department) for i in range(2)]
+
+    def test_retry_and_fail(self):
+        job = submit_job(self.employees)
+        with self.settings(POLLS={'PDF_JOB_MAX_ATTEMPTS': 2}):
+            for expected_status in [PdfJob.STATUS_PENDING, PdfJob.STATUS_FAILED]:
+                self.assertEqual(claim_jobs(1), [job.pk])
+                fail_job(job.pk, RuntimeError('Layout error'))
+                job.refresh_from_db()
+                self.assertEqual(job.status, expected_status)
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_expiry(self):
+        job = submit_job(self.employees)
+        finish_job(job.pk, b'%PDF')
+        PdfJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(expire_jobs(), (1, 0))
+        self.assertFalse(PdfJob.objects.exists())
+
+    def test_abandoned_jobs_use_up_attempts(self):
+        jobs = [submit_job(self.employees), submit_job(self.employees)]
+        self.assertEqual(claim_jobs(2), [job.pk for job in jobs])
+        PdfJob.objects.filter(pk=jobs[1].pk).update(attempts=3)
+        PdfJob.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(expire_jobs(), (0, 1))
+        self.assertEqual([PdfJob.objects.get(pk=job.pk).status for job in jobs],
+                         [PdfJob.STATUS_PENDING, PdfJob.STATUS_FAILED])
+
+    def test_worker_replaces_broken_pool(self):
+        Employee.objects.filter(pk=self.employees[0].pk).update(last_name='Crash')
+        crashing, job = submit_job(self.employees[:1]), submit_job(self.employees[1:])
+        with mock.patch('polls.jobs.render_cover_letters_serially', render_or_crash):
+            run_worker(processes=1, poll_interval=0.1, once=True)
+        crashing.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((crashing.status, crashing.attempts), (PdfJob.STATUS_FAILED, 3))
+        self.assertEqual(job.status, PdfJob.STATUS_DONE)
+
+
 class TemplateSerializerTest(TestCase):
     """
     Unit test case for the TemplateSerializer.
@@ -27,6 +27,7 @@ router.register(r'employees', views.EmployeeViewSet)
 router.register(r'departments', views.DepartmentViewSet)
 router.register(r'appointments', views.AppointmentViewSet)
 router.register(r'templates', views.TemplateViewSet)
+router.register(r'jobs', views.PdfJobViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -34,6 +35,8 @@ urlpatterns = [
     # path('api-token-auth/', obtain_auth_token, name='api-token-auth'),
     path('gen-pdf/<int:pk>/', views.GenerateCoverLetterAsPDF.as_view(),
          name='pdf_generation'),
+    path('gen-pdf/batch/', views.GenerateCoverLettersAsPDF.as_view(),
+         name='batch_pdf_generation'),
     path('gen-html/<int:pk>/', views.GenerateCoverLetterAsHtml.as_view(),
          name='html_generation'),
     path('update-template/', views.UpdateCoverLetterTemplate.as_view(),
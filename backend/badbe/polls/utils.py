@@ -1,22 +1,133 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+import django
+from django.conf import settings
 from django.http import HttpResponse
 from django.template.loader import get_template
 from django.template import Template, Context
 from django.utils import timezone
 
+from PyPDF2 import PdfFileMerger
 from xhtml2pdf import pisa
 
+from polls.letter_cache import letter_cache
 
-def render_to_pdf(template_src, context_dict={}):
+COVER_LETTER_TEMPLATE = 'cover_letter/cover_letter.html'
+
+
+def render_pdf_bytes(template_src, context_dict={}):
     template = get_template(template_src)
     html = template.render(context_dict)
     result = BytesIO()
     pdf = pisa.pisaDocument(BytesIO(html.encode("utf-8")), result)
     if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
+        return result.getvalue()
     return None
 
 
+def render_to_pdf(template_src, context_dict={}):
+    pdf = render_pdf_bytes(template_src, context_dict)
+    if pdf is not None:
+        return HttpResponse(pdf, content_type='application/pdf')
+    return None
+
+
+def cover_letter_context(employee, today=None):
+    """
+    Returns the dictionary expected by the cover letter template for the given `polls.models.Employee`.
+    Contains plain values only, so that it can be sent to a render worker process.
+    """
+    return {"employee": {
+        'first_name': employee.first_name,
+        'last_name': employee.last_name,
+        'id': employee.id,
+        'gender': employee.gender,
+        'department': str(employee.department),
+    },
+        'today': today or timezone.now()
+    }
+
+
+def merge_pdfs(pdfs):
+    """
+    Merges the given PDF documents (as bytes) into one document in the given order.
+    """
+    merger = PdfFileMerger()
+    for pdf in pdfs:
+        merger.append(BytesIO(pdf))
+    result = BytesIO()
+    merger.write(result)
+    merger.close()
+    return result.getvalue()
+
+
+def init_render_worker():
+    """
+    Initializes a render worker process.
+    Worker processes may be spawned instead of forked, in which case Django is not set up yet.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'badbe.settings')
+    django.setup()
+
+
+def render_cover_letter_pdf(context_dict):
+    """
+    Renders the cover letter PDF for the given template context, serving repeated renders from the letter cache.
+    """
+    return letter_cache.get_or_render(COVER_LETTER_TEMPLATE, context_dict, 'pdf', render_pdf_bytes)
+
+
+def _render_cover_letter(context_dict):
+    return context_dict['employee']['id'], render_cover_letter_pdf(context_dict)
+
+
+def render_cover_letters_serially(contexts):
+    """
+    Renders the cover letters for the given template contexts in the current process and merges them into one PDF.
+    Raises a RuntimeError if any of the letters cannot be rendered.
+    """
+    pdfs = []
+    for context_dict in contexts:
+        employee_id, pdf = _render_cover_letter(context_dict)
+        if pdf is None:
+            raise RuntimeError(f'The cover letter of employee {employee_id} could not be rendered.')
+        pdfs.append(pdf)
+    return merge_pdfs(pdfs)
+
+
+def render_cover_letters_to_pdf(employees, max_workers=None):
+    """
+    Renders the cover letters of the given employees in parallel worker processes and merges them into one PDF.
+    :param employees: An iterable of `polls.models.Employee` objects (with their department).
+    :param max_workers: The number of worker processes, defaults to `POLLS['PDF_RENDER_WORKERS']` or the CPU count.
+    :return: A tuple of the merged PDF as bytes (None if no letter could be rendered)
+    and the ids of the employees whose letters failed to render.
+    """
+    today = timezone.now()
+    contexts = [cover_letter_context(employee, today) for employee in employees]
+    if not contexts:
+        return None, []
+
+    max_workers = max_workers or settings.POLLS.get('PDF_RENDER_WORKERS') or os.cpu_count()
+    pdfs = []
+    failed = []
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(contexts)), initializer=init_render_worker) as pool:
+        # map() preserves the order of the employees in the merged document
+        for employee_id, pdf in pool.map(_render_cover_letter, contexts):
+            if pdf is None:
+                failed.append(employee_id)
+            else:
+                pdfs.append(pdf)
+
+    if not pdfs:
+        return None, failed
+    return merge_pdfs(pdfs), failed
+
+
 def render_to_html(template_src, context_dict={}):
     template = get_template(template_src)
     html = template.render(context_dict)
@@ -26,8 +137,72 @@ def render_to_html(template_src, context_dict={}):
     return None
 
 
-def fill_template(template_content, employee):
-    template = Template(template_content)
+class CompiledTemplateCache:
+    """
+    A bounded, thread-safe LRU cache of compiled `django.template.Template` objects.
+    Entries are keyed by the primary key of the `polls.models.Template` and a hash of its body,
+    so a modified template body never hits a stale entry.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, template_id, template_content):
+        """
+        Returns the compiled template for the given body, compiling and caching it on a miss.
+        """
+        key = (template_id, hashlib.sha1(template_content.encode('utf-8')).hexdigest())
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        template = Template(template_content)
+
+        with self._lock:
+            self._templates[key] = template
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+                self.evictions += 1
+        return template
+
+    def invalidate(self, template_id):
+        """
+        Drops all cached entries of the given template.
+        """
+        with self._lock:
+            for key in [key for key in self._templates if key[0] == template_id]:
+                del self._templates[key]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._templates),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+template_cache = CompiledTemplateCache(settings.POLLS.get('TEMPLATE_CACHE_SIZE', 64))
+
+
+def fill_template(template_content, employee, template_id=None):
+    template = template_cache.get(template_id, template_content)
     context = Context(employee)
     context.push({"today": timezone.now()})
     return template.render(context)
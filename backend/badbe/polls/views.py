@@ -1,29 +1,48 @@
-from django.http import HttpResponse, Http404
+from django.conf import settings
+from django.http import HttpResponse, Http404, FileResponse
 from django.contrib.auth import logout, authenticate, login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required, user_passes_test, permission_required
 from django.contrib.auth.mixins import UserPassesTestMixin, AccessMixin
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
 from django.utils.safestring import mark_safe
 from rest_framework import status, mixins, generics, permissions, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.decorators import api_view
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
-from polls.models import Employee, Department, Account, Template, Appointment
+from polls.bulk import EmployeeBulkWriter, AppointmentBulkWriter, find_conflicts
+from polls.exporter import EXPORT_FORMATS, EMPLOYEE_EXPORT_COLUMNS, APPOINTMENT_EXPORT_COLUMNS, export_response
+from polls.importer import EmployeeImporter, IMPORT_FORMATS, guess_import_format, read_rows
+from polls.jobs import submit_job
+from polls.models import Employee, Department, Account, Template, Appointment, PdfJob, Tombstone, TableVersion
 from polls.serializers import EmployeeSerializer, DepartmentSerializer, AccountSerializer, AppointmentSerializer, \
-    TemplateSerializer
+    TemplateSerializer, CoverLetterBatchSerializer, PdfJobSerializer, LeanRowSerializer, \
+    AppointmentScheduleSerializer, AppointmentCalendarSerializer, ProposedAppointmentSerializer
+from polls.pagination import KeysetPagination
 from polls.permissions import IsAccountOwner
+from polls.ical import ics_response
+from polls.renderers import dumps, FastJSONRenderer, ICalendarRenderer
+from polls.reminders import due_reminders, reminder_forecast
+from polls.scheduler import schedule_appointments
 from django.views.generic import ListView
-from django.db.models import Q, F
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Count, Prefetch
 from django_filters import rest_framework as filters
-from datetime import date
+from datetime import date, timedelta
 from rest_framework.decorators import action
-from polls.utils import render_to_pdf, render_to_html, fill_template
+from polls.utils import render_to_html, fill_template, template_cache, cover_letter_context, \
+    render_cover_letters_to_pdf, render_cover_letter_pdf, COVER_LETTER_TEMPLATE
+from io import BytesIO
+import codecs
+import hashlib
 import json
 import datetime
-import calendar
 
 
 @api_view(['GET'])
@@ -38,6 +57,208 @@ def api_root(request, format=None):
     })
 
 
+class SparseFieldsetQuerysetMixin:
+    """
+    Loads only the columns selected by the `fields` and `omit` query parameters of read requests.
+    To be combined with a serializer using `polls.serializers.SparseFieldsetMixin`.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        requested_fields = self.get_serializer_class().get_requested_fields(self.request.query_params)
+        # the ordering fields are needed to build pagination cursors
+        return queryset.only(*model_fields.intersection(requested_fields + queryset.model._meta.ordering))
+
+
+class ConditionalGetMixin:
+    """
+    Answers list and detail requests with a strong ETag and a Last-Modified header derived from the
+    version counters of the `etag_models` (see `polls.models.TableVersion`). Requests carrying a matching
+    If-None-Match (or If-Modified-Since) header get a 304 Not Modified without querying or serializing anything.
+    """
+    etag_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def get_validators(self, request):
+        """
+        Returns the ETag and the last modification time of the requested representation.
+        """
+        versions = TableVersion.objects.versions(*(self.etag_models or (self.queryset.model,)))
+        fingerprint = json.dumps([request.get_full_path(), request.accepted_media_type,
+                                  sorted((model, version) for model, (version, _) in versions.items())])
+        etag = f'"{hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()}"'
+        last_modified = max((updated_at for _, updated_at in versions.values()), default=None)
+        return etag, last_modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        headers = {'ETag': etag}
+        if last_modified:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_none_match is not None:
+            not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+        else:
+            not_modified = bool(last_modified and if_modified_since
+                                and int(last_modified.timestamp()) <= if_modified_since)
+        if not_modified:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+
+class DeltaSyncMixin:
+    """
+    Adds the `updated_since` query parameter (an ISO 8601 date time) to the list endpoint.
+    If present, the list only contains the objects modified after that time, and the response
+    additionally holds the ids of the objects deleted since then and a `watermark`, which the
+    client should send as `updated_since` in its next request.
+    The watermark lies `POLLS['DELTA_SYNC_MARGIN_SECONDS']` in the past, so that rows committed late are not
+    skipped, clients thus have to expect objects they already received.
+    If `updated_since` lies before the retention window of the deletions (see `polls.models.TombstoneManager`),
+    the list contains all objects and `full_resync` is true, the client then has to replace its copy.
+    """
+
+    def get_updated_since(self):
+        value = self.request.query_params.get('updated_since')
+        if value is None:
+            return None
+        # an unescaped '+' of the UTC offset arrives as a space
+        updated_since = parse_datetime(value.replace(' ', '+'))
+        if updated_since is None:
+            raise ValidationError({'updated_since': 'Expected an ISO 8601 date time.'})
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since)
+        return updated_since
+
+    def requires_full_resync(self, updated_since):
+        return updated_since < Tombstone.objects.retained_since()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        updated_since = self.get_updated_since() if self.action == 'list' else None
+        if updated_since and not self.requires_full_resync(updated_since):
+            queryset = queryset.filter(updated_at__gt=updated_since)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        updated_since = self.get_updated_since()
+        if updated_since is None:
+            return super().list(request, *args, **kwargs)
+
+        # taken before querying and moved back by the margin, since updated_at is stamped before the commit
+        watermark = timezone.now() - timedelta(seconds=settings.POLLS.get('DELTA_SYNC_MARGIN_SECONDS', 60))
+        full_resync = self.requires_full_resync(updated_since)
+        response = super().list(request, *args, **kwargs)
+        data = response.data if isinstance(response.data, dict) else {'results': response.data}
+        data['deleted'] = [] if full_resync else list(
+            Tombstone.objects.filter(model=self.queryset.model._meta.label, deleted_at__gt=updated_since)
+            .values_list('object_id', flat=True).distinct())
+        data['full_resync'] = full_resync
+        data['watermark'] = watermark.isoformat()
+        response.data = data
+        return response
+
+
+class LeanListMixin:
+    """
+    Serializes the list with `polls.serializers.LeanRowSerializer` from `values_list()` rows instead of
+    model instances, unless disabled with `POLLS['LEAN_LIST_SERIALIZATION']`.
+    The output is the same as the one of the serializer class.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        if not settings.POLLS.get('LEAN_LIST_SERIALIZATION', True) or not LeanRowSerializer.supports(serializer):
+            return super().list(request, *args, **kwargs)
+
+        lean_serializer = LeanRowSerializer(serializer)
+        queryset = self.filter_queryset(self.get_queryset())
+        # the pagination cursor is built from the ordering fields
+        ordering = [field for field in queryset.model._meta.ordering + ['id'] if field not in lean_serializer.columns]
+        rows = queryset.values_list(*lean_serializer.columns, *ordering, named=True)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(lean_serializer.to_representation(page))
+        return Response(lean_serializer.to_representation(rows))
+
+
+class BulkMixin:
+    """
+    Adds a `bulk` endpoint to the list route: POST a list of objects to create them,
+    PATCH a list of objects containing their ids to update them (see `polls.bulk`).
+    The batch is validated as a whole and written in a single transaction. By default, the batch is rejected
+    if any object is invalid; with `?atomic=false` the valid objects are written anyway.
+    The errors of invalid objects are reported with their index in the batch.
+    With `?duplicates=merge`, new objects which duplicate an existing object or an earlier object of the batch
+    (see `BulkWriter.unique_fields`) are skipped instead, their indexes are reported as `merged`.
+    """
+    bulk_writer_class = None
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        items = request.data
+        max_items = settings.POLLS.get('BULK_MAX_ITEMS', 5000)
+        if not isinstance(items, list) or len(items) > max_items:
+            return Response({
+                'status': 'Bad request',
+                'message': f'Expected a list of at most {max_items} objects.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        atomic = request.query_params.get('atomic', 'true').lower() not in ('false', '0')
+        writer = self.bulk_writer_class(context=self.get_serializer_context())
+        partial = request.method == 'PATCH'
+        merge_duplicates = request.query_params.get('duplicates') == 'merge'
+        valid, errors = writer.validate(items, partial=partial, merge_duplicates=merge_duplicates)
+        errors = [{'index': index, 'errors': detail} for index, detail in sorted(errors.items())]
+        if errors and (atomic or not valid):
+            return Response({'results': [], 'errors': errors, 'merged': writer.merged},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if partial:
+            objs = writer.update([(instance, data) for _, instance, data in valid])
+        else:
+            objs = writer.create([data for _, _, data in valid])
+        serializer = self.get_serializer(objs, many=True)
+        return Response({'results': serializer.data, 'errors': errors, 'merged': writer.merged},
+                        status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED)
+
+
+class ExportMixin:
+    """
+    Adds an `export` endpoint to the list route, which streams all (filtered) objects as CSV (default) or,
+    with `?output_format=ndjson`, as newline delimited JSON (see `polls.exporter`).
+    """
+    export_columns = ()
+
+    @action(detail=False)
+    def export(self, request):
+        output_format = request.query_params.get('output_format', EXPORT_FORMATS[0])
+        if output_format not in EXPORT_FORMATS:
+            return Response({
+                'status': 'Bad request',
+                'message': f'Unknown output format "{output_format}", expected one of {", ".join(EXPORT_FORMATS)}.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        model = self.queryset.model
+        # ordered like the keyset pagination, which is served by an index
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*model._meta.ordering, 'id')
+        return export_response(queryset, self.export_columns, output_format, model._meta.verbose_name_plural)
+
+
 class EmployeeFilter(filters.FilterSet):
     """
     A filter which determines attributes by which employees can be filtered.
@@ -55,28 +276,89 @@ class EmployeeFilter(filters.FilterSet):
                   'reminder_after', 'reminder_before']
 
 
-class EmployeeViewSet(viewsets.ModelViewSet):
+class EmployeeViewSet(ConditionalGetMixin, DeltaSyncMixin, LeanListMixin, SparseFieldsetQuerysetMixin, BulkMixin,
+                      ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for the `polls.models.Employee` model.
-    Provides endpoints or listing, creating, updating and modifying employees.
+    Provides endpoints or listing, creating, updating and modifying employees, also in batches (`/employees/bulk/`),
+    and for exporting them (`/employees/export/`). `/employees/forecast/` projects the reminders of the next months.
+    Read requests accept `?fields=` and `?omit=` to restrict the returned fields,
+    the list accepts `?updated_since=` for delta synchronization.
     """
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
+    bulk_writer_class = EmployeeBulkWriter
+    export_columns = EMPLOYEE_EXPORT_COLUMNS
+    pagination_class = KeysetPagination
     # permission_classes = [permissions.IsAuthenticated]
 
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = EmployeeFilter
 
+    # returns the employees whose reminder is due around today, most urgent first (see polls.reminders)
+    @action(detail=False)
+    def due(self, request):
+        return Response(due_reminders())
 
-class TemplateViewSet(viewsets.ModelViewSet):
+    # projects the number of reminders per department for each of the next ?months= (default 12, at most 36) months
+    @action(detail=False)
+    def forecast(self, request):
+        try:
+            months = int(request.query_params.get('months', 12))
+        except ValueError:
+            months = 0
+        if not 1 <= months <= 36:
+            return Response({
+                'status': 'Bad request',
+                'message': 'Expected the number of months (1 to 36) as months.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(reminder_forecast(months))
+
+    # upserts the employees of an uploaded CSV or NDJSON file (see polls.importer)
+    # the format is guessed from the file name unless given with ?input_format=, ?dry_run=true only reports the diff
+    # responds with the summary and the first invalid rows, the import_employees command reports every change
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        input_format = request.query_params.get('input_format') or (upload and guess_import_format(upload.name))
+        if upload is None or input_format not in IMPORT_FORMATS:
+            return Response({
+                'status': 'Bad request',
+                'message': f'Expected a file in one of the formats {", ".join(IMPORT_FORMATS)}.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = EmployeeImporter(dry_run=request.query_params.get('dry_run', '').lower() in ('true', '1'))
+        rows = read_rows(codecs.iterdecode(upload, 'utf-8-sig'), input_format)
+        sample_size, errors = settings.POLLS.get('IMPORT_ERROR_SAMPLE_SIZE', 100), []
+        for record in importer.run(rows):
+            if record['action'] == 'error' and len(errors) < sample_size:
+                errors.append(record)
+        return Response({'dry_run': importer.dry_run, 'summary': importer.summary, 'errors': errors})
+
+
+class TemplateViewSet(ConditionalGetMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """
     ViewSet for the `polls.models.Template` model.
     Provides endpoints or listing, creating, updating and modifying printable letter templates.
+    The list accepts `?updated_since=` for delta synchronization.
     """
     queryset = Template.objects.all()
     serializer_class = TemplateSerializer
     # permission_classes = [permissions.IsAuthenticated]
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        template_cache.invalidate(serializer.instance.pk)
+
+    def perform_destroy(self, instance):
+        template_cache.invalidate(instance.pk)
+        super().perform_destroy(instance)
+
+    # returns the hit/miss/eviction counters of the compiled template cache
+    @action(detail=False, url_path='cache-stats')
+    def cache_stats(self, request):
+        return Response(template_cache.stats())
+
 
 class FilledTemplateViewSet(APIView):
     def get(self, request, pk, ek, format=None):
@@ -85,10 +367,10 @@ class FilledTemplateViewSet(APIView):
         template = Template.objects.get(pk=pk)
 
         serializer = EmployeeSerializer(employee)
-        html = fill_template(template.template_body, serializer.data)
+        html = fill_template(template.template_body, serializer.data, template.pk)
 
         if html:
-            return HttpResponse(json.dumps({"template_body": html, "name": template.name}), content_type='application/json')
+            return HttpResponse(dumps({"template_body": html, "name": template.name}), content_type='application/json')
         else:
             return Response({
                 'status': 'Internal Error',
@@ -96,15 +378,51 @@ class FilledTemplateViewSet(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for the `polls.models.Department` model.
     Provides endpoints or listing, creating, updating and modifying departments.
+    Read requests accept `?employees=links|ids|count` to select how the employees are represented.
+    Changing the reminder interval cascades to the employees, `reminder-interval-preview` reports the effect beforehand.
+    The `stats` of the departments are read from `polls.models.DepartmentStats` instead of counting the employees,
+    stale ones are rebuilt by the `reconcile_department_stats` command.
     """
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    # the employee_set and the stats depend on the employee and appointment tables
+    etag_models = (Department, Employee, Appointment)
     # permission_classes = [permissions.IsAuthenticated]
 
+    # the due and overdue counts of the stats change with the date
+    def get_validators(self, request):
+        etag, last_modified = super().get_validators(request)
+        today = timezone.localdate()
+        etag = f'"{hashlib.sha1(f"{etag}{today.isoformat()}".encode("utf-8")).hexdigest()}"'
+        midnight = timezone.make_aware(datetime.datetime.combine(today, datetime.time()))
+        return etag, max(last_modified, midnight) if last_modified else midnight
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('stats')
+        if self.serializer_class.get_employee_set_mode(self.request.query_params) == 'count':
+            return queryset.annotate(employee_count=Count('employee'))
+        return queryset.prefetch_related(Prefetch('employee_set', queryset=Employee.objects.only('id', 'department')))
+
+    # reports how the employees would change if the reminder interval was set to ?reminder_interval=
+    @action(detail=True, url_path='reminder-interval-preview')
+    def reminder_interval_preview(self, request, pk=None):
+        department = self.get_object()
+        try:
+            interval = int(request.query_params['reminder_interval'])
+        except (KeyError, ValueError):
+            return Response({
+                'status': 'Bad request',
+                'message': 'Expected the new reminder interval (in months) as reminder_interval.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        preview = Employee.objects.filter(department=department).preview_reminder_interval(
+            department.reminder_interval, interval)
+        return Response(dict(preview, reminder_interval=interval,
+                             previous_reminder_interval=department.reminder_interval))
+
 
 class AppointmentFilter(filters.FilterSet):
     """
@@ -113,31 +431,107 @@ class AppointmentFilter(filters.FilterSet):
 
     min_date = filters.DateFilter(field_name="date", lookup_expr='gte')
     max_date = filters.DateFilter(field_name="date", lookup_expr='lte')
+    department = filters.NumberFilter(field_name="employee__department")
 
     class Meta:
         model = Appointment
-        fields = ['min_date', 'max_date', 'employee']
+        fields = ['min_date', 'max_date', 'employee', 'department']
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ConditionalGetMixin, DeltaSyncMixin, LeanListMixin, SparseFieldsetQuerysetMixin, BulkMixin,
+                         ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for the `polls.models.Appointment` model.
+    Batches of appointments can be created and modified with `/appointments/bulk/`,
+    the (filtered) appointment history is exported with `/appointments/export/`,
+    `/appointments/calendar/` counts the appointments per day of a month, `/appointments/ics/` is an iCalendar feed,
+    `/appointments/conflicts/` checks a batch of proposed appointments for double bookings
+    and appointments for the due employees are scheduled automatically with `/appointments/schedule/`.
+    Read requests accept `?fields=` and `?omit=` to restrict the returned fields,
+    the list accepts `?updated_since=` for delta synchronization.
     """
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    bulk_writer_class = AppointmentBulkWriter
+    export_columns = APPOINTMENT_EXPORT_COLUMNS
+    pagination_class = KeysetPagination
     # permission_classes = [permissions.IsAuthenticated]
 
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = AppointmentFilter
 
+    # counts the (filtered) appointments per day of ?month= or ?start=&end=, see AppointmentCalendarSerializer
+    @action(detail=False)
+    def calendar(self, request):
+        # the departments of the employees are part of the breakdown
+        self.etag_models = (Appointment, Employee)
+        return self.conditional_response(self.calendar_response, request)
+
+    def calendar_response(self, request):
+        serializer = AppointmentCalendarSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.summarize(self.filter_queryset(Appointment.objects.all())))
+
+    # streams the (filtered) appointments as an iCalendar feed, e.g. ?department=&min_date= for calendar apps
+    @action(detail=False, renderer_classes=[ICalendarRenderer, FastJSONRenderer])
+    def ics(self, request):
+        # the events show the names of the employees and departments
+        self.etag_models = (Appointment, Employee, Department)
+        return self.conditional_response(self.ics_feed, request)
+
+    def ics_feed(self, request):
+        queryset = self.filter_queryset(Appointment.objects.all()).order_by('date', 'id')
+        return ics_response(queryset, request.get_host().split(':')[0])
+
+    # reports which of the posted list of proposed appointments ({employee, date}) would be double bookings
+    @action(detail=False, methods=['post'])
+    def conflicts(self, request):
+        max_items = settings.POLLS.get('BULK_MAX_ITEMS', 5000)
+        if not isinstance(request.data, list) or len(request.data) > max_items:
+            return Response({
+                'status': 'Bad request',
+                'message': f'Expected a list of at most {max_items} objects.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ProposedAppointmentSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        conflicts = find_conflicts([(item['employee'], item['date']) for item in serializer.validated_data])
+        for conflict in conflicts:
+            conflict['date'] = conflict['date'].strftime('%d.%m.%Y')
+        return Response({'conflicts': conflicts})
+
+    # schedules appointments for the due employees with a limited capacity per day (see polls.scheduler)
+    @action(detail=False, methods=['post'])
+    def schedule(self, request):
+        serializer = AppointmentScheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dry_run = serializer.validated_data['dry_run']
+        try:
+            planned, unscheduled = schedule_appointments(**serializer.validated_data)
+        except IntegrityError:
+            # an appointment of one of the employees was booked concurrently
+            return Response({
+                'status': 'Conflict',
+                'message': 'Appointments were booked concurrently, please try again.'
+            }, status=status.HTTP_409_CONFLICT)
+        appointments = [{'employee': employee_id, 'date': day.strftime('%d.%m.%Y')} for employee_id, day in planned]
+        return Response({'dry_run': dry_run, 'appointments': appointments, 'unscheduled': unscheduled},
+                        status=status.HTTP_200_OK if dry_run or not planned else status.HTTP_201_CREATED)
+
+    # automatically recomputes next_reminder of the employee whose appointment was deleted
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Employee.objects.filter(pk=instance.employee_id).refresh_appointment_dates()
 
-class AccountViewSet(viewsets.ModelViewSet):
+
+class AccountViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for the `polls.models.Account` custom user model.
     """
     lookup_field = 'id'
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
+    pagination_class = KeysetPagination
 
     # permission_classes = [permissions.IsAuthenticated]
 
@@ -169,7 +563,7 @@ class LoginView(UserPassesTestMixin, APIView):
         return True
 
     def post(self, request, format=None):
-        data = json.loads(request.body)
+        data = request.data
 
         email = data.get('email', None)
         password = data.get('password', None)
@@ -205,6 +599,7 @@ class LogoutView(APIView):
 
 # employee details are taken from the database matching the pk
 # pdf rendered from the cover letter template passing the employee details(currently just last name necessary)
+# repeated renders of an unchanged letter are served from the on-disk letter cache
 # returns PDF file on success
 class GenerateCoverLetterAsPDF(APIView):
     def get_employee(self, pk):
@@ -215,19 +610,7 @@ class GenerateCoverLetterAsPDF(APIView):
 
     def get(self, request, pk, format=None):
         employee_obj = self.get_employee(pk)
-
-        today = timezone.now()
-        # dictionary as expected by the renderer
-        employee = {"employee": {
-            'first_name': employee_obj.first_name,
-            'last_name': employee_obj.last_name,
-            'id': employee_obj.id,
-            'gender': employee_obj.gender,
-            'department': employee_obj.department,
-        },
-            'today': today
-        }
-        pdf = render_to_pdf('cover_letter/cover_letter.html', employee)
+        pdf = render_cover_letter_pdf(cover_letter_context(employee_obj))
 
         if pdf:
             response = HttpResponse(pdf, content_type='application/pdf')
@@ -239,6 +622,33 @@ class GenerateCoverLetterAsPDF(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# employees are selected by a list of ids and/or a range of reminder dates
+# the cover letters are rendered in parallel worker processes and merged into a single PDF
+# returns the merged PDF file on success, the ids of letters which failed are listed in the X-Failed-Employees header
+class GenerateCoverLettersAsPDF(APIView):
+    def post(self, request, format=None):
+        serializer = CoverLetterBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        employees = list(serializer.selected_employees())
+        if not employees:
+            return Response({
+                'status': 'Bad request',
+                'message': 'No employees match the selection'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        pdf, failed = render_cover_letters_to_pdf(employees)
+
+        if pdf:
+            response = FileResponse(BytesIO(pdf), content_type='application/pdf')
+            response['X-Failed-Employees'] = ','.join(str(employee_id) for employee_id in failed)
+            return response
+        else:
+            return Response({
+                'status': 'Internal Error',
+                'message': 'PDF could not be generated'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # employee details are taken from the database matching the pk
 # html rendered from the cover letter template passing the employee details(currently just last name necessary)
 # returns HTML file on success
@@ -251,17 +661,7 @@ class GenerateCoverLetterAsHtml(APIView):
 
     def get(self, request, pk, format=None):
         employee_obj = self.get_employee(pk)
-        today = timezone.now()
-        employee = {"employee": {
-            'first_name': employee_obj.first_name,
-            'last_name': employee_obj.last_name,
-            'id': employee_obj.id,
-            'gender': employee_obj.gender,
-            'department': employee_obj.department,
-        },
-            'today': today
-        }
-        html = render_to_html('cover_letter/cover_letter.html', employee)
+        html = render_to_html(COVER_LETTER_TEMPLATE, cover_letter_context(employee_obj))
 
         if html:
             response = HttpResponse(html, content_type='text/html')
@@ -273,6 +673,43 @@ class GenerateCoverLetterAsHtml(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class PdfJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                    viewsets.GenericViewSet):
+    """
+    ViewSet for the `polls.models.PdfJob` model.
+    Provides endpoints for queueing cover letter PDF jobs, polling their status and downloading their result.
+    The jobs are processed by the `run_pdf_worker` management command.
+    """
+    queryset = PdfJob.objects.defer('result')
+    serializer_class = PdfJobSerializer
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        selection = CoverLetterBatchSerializer(data=request.data)
+        selection.is_valid(raise_exception=True)
+        employees = list(selection.selected_employees().values_list('id', flat=True))
+        if not employees:
+            return Response({
+                'status': 'Bad request',
+                'message': 'No employees match the selection'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        job = submit_job(employees)
+        serializer = self.get_serializer(job)
+        url = reverse('pdfjob-detail', kwargs={'pk': job.pk}, request=request)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+    # returns the rendered PDF once the job is done
+    @action(detail=True)
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != PdfJob.STATUS_DONE:
+            return Response({
+                'status': 'Conflict',
+                'message': f'The job is {job.status}'
+            }, status=status.HTTP_409_CONFLICT)
+        return HttpResponse(bytes(job.result), content_type='application/pdf')
+
+
 # overwrites the coverletter template with the data from POST request
 # complete html has to be send from the front end as it is just a blind write here
 class UpdateCoverLetterTemplate(APIView):
@@ -54,7 +54,7 @@ export class ArchivComponent implements OnInit {
   // Functionality for the search field
   search(searchterm: string) {
     this.employeeService
-      .get({ active: false, [this.selectedFilter]: searchterm })
+      .get({ active: false, pagination: 'offset', [this.selectedFilter]: searchterm })
       .subscribe(employees => {
         this.displayedArchivedEmployees = employees;
       });
@@ -62,7 +62,7 @@ export class ArchivComponent implements OnInit {
 
   // Updates the chached employees
   private updateDisplayedColumns() {
-    this.employeesService.get({ active: false }).subscribe(pagEmpl => {
+    this.employeesService.get({ active: false, pagination: 'offset' }).subscribe(pagEmpl => {
       this.displayedArchivedEmployees = pagEmpl;
     });
   }
@@ -77,25 +77,10 @@ export class HomeComponent implements OnInit {
       .catch(_ => {});
   }
 
-  // Update cached Employees in the needed interval
+  // Update cached Employees whose reminder is due
   updateEmployeeList() {
-    const now = new Date();
-
-    const aMonthBefore = new Date(now);
-    aMonthBefore.setMonth(aMonthBefore.getMonth() - 1);
-
-    const aMonthAfter = new Date(now);
-    aMonthAfter.setMonth(aMonthAfter.getMonth() + 1);
-
-    this.employeeService
-      .get({
-        active: true,
-        wants_reminder: true,
-        reminder_after: aMonthBefore.toLocaleDateString(),
-        reminder_before: aMonthAfter.toLocaleDateString()
-      })
-      .subscribe(employees => {
-        this.employees = employees;
-      });
+    this.employeeService.getDue().subscribe(employees => {
+      this.employees = employees;
+    });
   }
 }
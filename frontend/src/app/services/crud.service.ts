@@ -1,5 +1,13 @@
 import { HttpClient, HttpParams } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { EMPTY, Observable } from 'rxjs';
+import { expand, map, reduce } from 'rxjs/operators';
+
+// A page of results as returned by paginated list endpoints
+export interface IPage<Type> {
+  next: string | null;
+  previous: string | null;
+  results: Type[];
+}
 
 export abstract class CrudService<Type> {
   constructor(private url: string, protected http: HttpClient) {}
@@ -11,7 +19,16 @@ export abstract class CrudService<Type> {
         params = params.append(String(key), String(filter[key]));
       }
     }
-    return this.http.get<Type[]>(this.url, { params });
+    // Follows the `next` links of paginated responses until the last page
+    return this.http.get<Type[] | IPage<Type>>(this.url, { params }).pipe(
+      expand(response =>
+        Array.isArray(response) || !response.next
+          ? EMPTY
+          : this.http.get<IPage<Type>>(response.next)
+      ),
+      map(response => (Array.isArray(response) ? response : response.results)),
+      reduce((all: Type[], page: Type[]) => all.concat(page), [])
+    );
   }
 
   public getById(id: number): Observable<Type> {
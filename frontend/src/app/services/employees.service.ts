@@ -2,6 +2,7 @@ import { Injectable } from "@angular/core";
 import { IEmployee } from "../types";
 import { HttpClient } from "@angular/common/http";
 import { CrudService } from "./crud.service";
+import { Observable } from "rxjs";
 
 @Injectable({
   providedIn: "root"
@@ -10,4 +11,9 @@ export class EmployeesService extends CrudService<IEmployee> {
   constructor(http: HttpClient) {
     super("/employees/", http);
   }
+
+  // Employees whose reminder is due around today, most urgent first
+  public getDue(): Observable<IEmployee[]> {
+    return this.http.get<IEmployee[]>("/employees/due/");
+  }
 }
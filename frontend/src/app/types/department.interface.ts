@@ -1,4 +1,15 @@
+export interface IDepartmentStats {
+  active_employees: number;
+  due_soon: number;
+  overdue: number;
+  appointments_this_year: number;
+  computed_on: string; // the day the counters refer to
+  stale: boolean; // the counters wait for the next rebuild
+}
+
 export interface IDepartment {
   id: number;
   name: string;
+  reminder_interval?: number; // in months, cascades to the employees of the department
+  stats?: IDepartmentStats; // read-only counters maintained by the backend
 }